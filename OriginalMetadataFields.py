@@ -14,142 +14,29 @@
 """
 import arcpy
 import argparse
-import os
 
-def get_geodatabase_path(input_layer):
-    """
-    Gets the parent geodatabase of the layer
-    :param input_layer: (string) The feature layer to get the parent database of
-    :return: (string) The path to the geodatabase
-    """
-    workspace = os.path.dirname(arcpy.Describe(input_layer).catalogPath)
-    if [any(ext) for ext in ('.gdb', '.mdb', '.sde') if ext in os.path.splitext(workspace)]:
-        return workspace
-    else:
-        return os.path.dirname(workspace)
+import schemaTemplates
+from domainRegistry import DEFAULT_REGISTRY_PATH, DomainRegistry
+
+GNSS_PLAN = schemaTemplates.build_plan(['gnss'])
 
-def check_and_create_domains(geodatabase):
+def check_and_create_domains(geodatabase, registry=None):
     """
     Checks if the domains already exist, if they do
     then it checks the values and ranges
 
     If the domains do not exist, they are created
 
+    The domains come from the gnss template, see
+    schemaTemplates.check_and_create_domains with add_missing_codes False
+
     :param geodatabase: (string) the path to the geodatabase to check
-    :return:
+    :param registry: (DomainRegistry) Optional registry of verified geodatabases
+    :return: (boolean) True if the domains are ready to use
     """
-    domains = arcpy.da.ListDomains(geodatabase)
-    domain_names = [domain.name for domain in domains]
-    if 'ESRI_FIX_TYPE_DOMAIN' in domain_names:
-        for domain in domains:
-            if domain.name == 'ESRI_FIX_TYPE_DOMAIN':
-                # check if cvs 0,1,2,4,5 are in the codedValues
-                values = [cv for cv in domain.codedValues]
-                if not set(set([0, 1, 2, 4, 5])).issubset(values):
-                    arcpy.AddIDMessage("ERROR",355)
-                    return
-    else:
-        # Add the domain and values
-        arcpy.CreateDomain_management(in_workspace=geodatabase,
-                                      domain_name="ESRI_FIX_TYPE_DOMAIN",
-                                      domain_description="Fix Type",
-                                      field_type="SHORT",
-                                      domain_type="CODED",
-                                      split_policy="DEFAULT",
-                                      merge_policy="DEFAULT")
-
-        arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                               domain_name="ESRI_FIX_TYPE_DOMAIN",
-                                               code="0",
-                                               code_description="Fix not valid")
-        arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                               domain_name="ESRI_FIX_TYPE_DOMAIN",
-                                               code="1",
-                                               code_description="GPS")
-        arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                               domain_name="ESRI_FIX_TYPE_DOMAIN",
-                                               code="2",
-                                               code_description="Differential GPS")
-        arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                               domain_name="ESRI_FIX_TYPE_DOMAIN",
-                                               code="4",
-                                               code_description="RTK Fixed")
-        arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                               domain_name="ESRI_FIX_TYPE_DOMAIN",
-                                               code="5",
-                                               code_description="RTK Float")
-    # Check if 'NumSats" is a domain, if so check the range
-    if 'ESRI_NUM_SATS_DOMAIN' in domain_names:
-        if domain.name == "ESRI_NUM_SATS_DOMAIN":
-            if domain.range[0] != 0 or domain.range[1] != 99:
-                arcpy.AddIDMessage("ERROR",355)
-                return
-    else:
-        # Add the domain and set the range
-        arcpy.CreateDomain_management(in_workspace=geodatabase,
-                                      domain_name="ESRI_NUM_SATS_DOMAIN",
-                                      domain_description="Number of Satellites",
-                                      field_type="SHORT",
-                                      domain_type="RANGE",
-                                      split_policy="DEFAULT",
-                                      merge_policy="DEFAULT")
-        arcpy.SetValueForRangeDomain_management(geodatabase, "ESRI_NUM_SATS_DOMAIN", 0, 99)
-    # Check if 'StationID" is a domain, if so check the range
-    if 'ESRI_STATION_ID_DOMAIN' in domain_names:
-        if domain.name == "ESRI_STATION_ID_DOMAIN":
-            if domain.range[0] != 0 or domain.range[1] != 1023:
-                arcpy.AddIDMessage("ERROR",355)
-                return
-    else:
-        # Add the domain and set the range
-        arcpy.CreateDomain_management(in_workspace=geodatabase,
-                                      domain_name="ESRI_STATION_ID_DOMAIN",
-                                      domain_description="Station ID",
-                                      field_type="SHORT",
-                                      domain_type="RANGE",
-                                      split_policy="DEFAULT",
-                                      merge_policy="DEFAULT")
-        arcpy.SetValueForRangeDomain_management(geodatabase, "ESRI_STATION_ID_DOMAIN", 0, 1023)
-    if 'ESRI_POSITIONSOURCETYPE_DOMAIN' in domain_names:
-        for domain in domains:
-            if domain.name == 'ESRI_POSITIONSOURCETYPE_DOMAIN':
-                # check if cvs 0,1,2,3,4 are in the codedValues
-                values = [cv for cv in domain.codedValues]
-                if not set(set([0, 1, 2, 3, 4])).issubset(values):
-                    arcpy.AddError("ESRI_POSITIONSOURCETYPE_DOMAIN is missing a coded value pair.")
-                    return
-    else:
-        # Add the domain and values
-        arcpy.CreateDomain_management(in_workspace=geodatabase,
-                                      domain_name="ESRI_POSITIONSOURCETYPE_DOMAIN",
-                                      domain_description="Position Source Type",
-                                      field_type="SHORT",
-                                      domain_type="CODED",
-                                      split_policy="DEFAULT",
-                                      merge_policy="DEFAULT")
-
-        arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                               domain_name="ESRI_POSITIONSOURCETYPE_DOMAIN",
-                                               code="0",
-                                               code_description="Unknown")
-        arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                               domain_name="ESRI_POSITIONSOURCETYPE_DOMAIN",
-                                               code="1",
-                                               code_description="User defined")
-        arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                               domain_name="ESRI_POSITIONSOURCETYPE_DOMAIN",
-                                               code="2",
-                                               code_description="Integrated (System) Location Provider")
-        arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                               domain_name="ESRI_POSITIONSOURCETYPE_DOMAIN",
-                                               code="3",
-                                               code_description="External GNSS Receiver")
-        arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                               domain_name="ESRI_POSITIONSOURCETYPE_DOMAIN",
-                                               code="4",
-                                               code_description="Network Location Provider")
-
-def add_gnss_fields(feature_layer):
+    return schemaTemplates.check_and_create_domains(geodatabase, GNSS_PLAN, registry, add_missing_codes=False)
+
+def add_gnss_fields(feature_layer, registry=None):
     """
     This adds specific fields required for GPS units to
         auto-populate in collector application
@@ -163,6 +50,7 @@ def add_gnss_fields(feature_layer):
     Example: add_gps_fields(r"C:/temp/test.shp")
 
     :param feature_layer: (string) The feature layer (shapefile, feature class, etc) to add the fields to
+    :param registry: (DomainRegistry) Optional registry of geodatabases whose domains are already verified
     :return:
     """
 
@@ -187,9 +75,10 @@ def add_gnss_fields(feature_layer):
         # Check the domains to see if they exist and are valid
         # will update if necessary
 
+        geodatabase = None
         if r'/rest/services' not in arcpy.Describe(feature_layer).catalogPath:
-            geodatabase = get_geodatabase_path(feature_layer)
-            check_and_create_domains(geodatabase)
+            geodatabase = schemaTemplates.get_workspace(desc.catalogPath)
+            check_and_create_domains(geodatabase, registry)
 
         # Add the fields
 
@@ -401,6 +290,8 @@ def add_gnss_fields(feature_layer):
                 arcpy.AssignDomainToField_management(feature_layer, field, 'ESRI_POSITIONSOURCETYPE_DOMAIN')
                 continue
 
+        if registry is not None and geodatabase is not None:
+            registry.refresh_stamp(geodatabase)
 
     except Exception as e:
         arcpy.AddError("{}\n".format(e))
@@ -416,6 +307,13 @@ if __name__ == "__main__":
     """
     parser = argparse.ArgumentParser("Add GPS Fields to Feature Layers")
     parser.add_argument("layers", nargs='+', help="The layers to add fields to")
+    parser.add_argument("--registry", default=DEFAULT_REGISTRY_PATH,
+                        help="The domain registry file of already verified geodatabases")
+    parser.add_argument("--no-registry", action="store_true",
+                        help="Check the domains of every geodatabase without the registry")
     args = parser.parse_args()
+    registry = None if args.no_registry else DomainRegistry(args.registry)
     for layer in args.layers:
-        add_gnss_fields(layer)
+        add_gnss_fields(layer, registry)
+    if registry is not None:
+        registry.save()
@@ -14,252 +14,33 @@
 """
 import arcpy
 import argparse
-import os
+import numpy as np
 
+import schemaTemplates
+from chunkedCursor import DEFAULT_CHUNK_SIZE, CursorStats, get_array_type, read_chunks, update_from_array
+from domainRegistry import DEFAULT_REGISTRY_PATH, DomainRegistry
 
-def get_geodatabase_path(input_layer):
-    """
-    Gets the parent geodatabase of the layer
-    :param input_layer: (string) The feature layer to get the parent database of
-    :return: (string) The path to the geodatabase
-    """
-    workspace = os.path.dirname(arcpy.Describe(input_layer).catalogPath)
-    if [any(ext) for ext in ('.gdb', '.mdb', '.sde') if ext in os.path.splitext(workspace)]:
-        return workspace
-    else:
-        return os.path.dirname(workspace)
+WET_WEATHER_PLAN = schemaTemplates.build_plan(['wet_weather'])
 
 
-def check_and_create_domains(geodatabase):
+def check_and_create_domains(geodatabase, registry=None):
     """
     Checks if the domains already exist, if they do
-    then it checks the values and ranges
+    then it checks they have the codes of the canonical definitions
 
     If the domains do not exist, they are created
 
+    The domains come from the wet_weather template, see
+    schemaTemplates.check_and_create_domains with add_missing_codes False
+
     :param geodatabase: (string) the path to the geodatabase to check
-    :return:
+    :param registry: (DomainRegistry) Optional registry of verified geodatabases
+    :return: (boolean) True if the domains are ready to use
     """
-    domains = arcpy.da.ListDomains(geodatabase)
-    domain_names = [domain.name for domain in domains]
-    if 'Yes_No' in domain_names:
-        for domain in domains:
-            if domain.name == 'Yes_No':
-                # check if cvs 0,1,2,4,5 are in the codedValues
-                values = [cv for cv in domain.codedValues]
-                if not set(set([0, 1, 2, 4, 5])).issubset(values):
-                    arcpy.AddIDMessage("ERROR This domain already exists")
-                    return
-    else:
-        # Add the domain and values
-        arcpy.CreateDomain_management(in_workspace=geodatabase,
-                                      domain_name="Yes_No",
-                                      domain_description="Yes or No",
-                                      field_type="TEXT",
-                                      domain_type="CODED",
-                                      split_policy="DEFAULT",
-                                      merge_policy="DEFAULT")
-
-        arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                               domain_name="Yes_No",
-                                               code="Yes",
-                                               code_description="Yes")
-        arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                               domain_name="Yes_No",
-                                               code="No",
-                                               code_description="No")
-        arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                               domain_name="Yes_No",
-                                               code="N/A",
-                                               code_description="N/A")
-
-    # Check if 'Inspector" is a domain, if so check the range
-    if 'Inspector' in domain_names:
-        for domain in domains:
-            if domain.name == 'Inspector':
-                # check if cvs 0,1,2,4,5 are in the codedValues
-                values = [cv for cv in domain.codedValues]
-                if not set(set([0, 1, 2, 4, 5])).issubset(values):
-                    arcpy.AddIDMessage("ERROR This domain already exists")
-                    return
-    else:
-        # Add the domain and set the range
-        arcpy.CreateDomain_management(in_workspace=geodatabase,
-                                      domain_name="Inspector",
-                                      domain_description="Inspector",
-                                      field_type="TEXT",
-                                      domain_type="CODED",
-                                      split_policy="DEFAULT",
-                                      merge_policy="DEFAULT")
-
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Inspector",
-                                           code="ALA",
-                                           code_description="ALA")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Inspector",
-                                           code="BAR",
-                                           code_description="BAR")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Inspector",
-                                           code="BUR",
-                                           code_description="BUR")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Inspector",
-                                           code="CAS",
-                                           code_description="CAS")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Inspector",
-                                           code="JJH",
-                                           code_description="JJH")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Inspector",
-                                           code="JLK",
-                                           code_description="JLK")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Inspector",
-                                           code="JWN",
-                                           code_description="JWN")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Inspector",
-                                           code="MJT",
-                                           code_description="MJT")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Inspector",
-                                           code="REM",
-                                           code_description="REM")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Inspector",
-                                           code="RWG",
-                                           code_description="RWG")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Inspector",
-                                           code="SAB",
-                                           code_description="SAB")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Inspector",
-                                           code="SJS",
-                                           code_description="SJS")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Inspector",
-                                           code="SUB",
-                                           code_description="SUB")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Inspector",
-                                           code="WBH",
-                                           code_description="WBH")
-
-
-#  Check if Flow Percentage is a domain
-    if 'Flow_Percent' in domain_names:
-        for domain in domains:
-            if domain.name == 'Flow_Percent':
-                # check if cvs 0,1,2,4,5 are in the codedValues
-                values = [cv for cv in domain.codedValues]
-                if not set(set([0, 1, 2, 4, 5])).issubset(values):
-                    arcpy.AddIDMessage("ERROR This domain already exists")
-                    return
-    else:
-        # Add the domain and set the range
-        arcpy.CreateDomain_management(in_workspace=geodatabase,
-                                      domain_name="Flow_Percent",
-                                      domain_description="Flow Percentage",
-                                      field_type="TEXT",
-                                      domain_type="CODED",
-                                      split_policy="DEFAULT",
-                                      merge_policy="DEFAULT")
-
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Flow_Percent",
-                                           code="0",
-                                           code_description="0% (No Flow)")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Flow_Percent",
-                                           code="25",
-                                           code_description="25%")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Flow_Percent",
-                                           code="50",
-                                           code_description="50%")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Flow_Percent",
-                                           code="75",
-                                           code_description="75%")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Flow_Percent",
-                                           code="100",
-                                           code_description="100%")
-
-#  Check if Clock Position is a domain
-    if 'Clock_Pos' in domain_names:
-        for domain in domains:
-            if domain.name == 'Clock_Pos':
-                # check if cvs 0,1,2,4,5 are in the codedValues
-                values = [cv for cv in domain.codedValues]
-                if not set(set([0, 1, 2, 4, 5])).issubset(values):
-                    arcpy.AddIDMessage("ERROR This domain already exists")
-                    return
-    else:
-        # Add the domain and set the range
-        arcpy.CreateDomain_management(in_workspace=geodatabase,
-                                      domain_name="Clock_Pos",
-                                      domain_description="Clock Position",
-                                      field_type="TEXT",
-                                      domain_type="CODED",
-                                      split_policy="DEFAULT",
-                                      merge_policy="DEFAULT")
-
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Clock_Pos",
-                                           code="1",
-                                           code_description="1 o'clock")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Clock_Pos",
-                                           code="10",
-                                           code_description="10 o'clock")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Clock_Pos",
-                                           code="11",
-                                           code_description="11 o'clock")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Clock_Pos",
-                                           code="12",
-                                           code_description="12 o'clock")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Clock_Pos",
-                                           code="2",
-                                           code_description="2 o'clock")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Clock_Pos",
-                                           code="3",
-                                           code_description="3 o'clock")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Clock_Pos",
-                                           code="4",
-                                           code_description="4 o'clock")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Clock_Pos",
-                                           code="5",
-                                           code_description="5 o'clock")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Clock_Pos",
-                                           code="6",
-                                           code_description="6 o'clock")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Clock_Pos",
-                                           code="7",
-                                           code_description="7 o'clock")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Clock_Pos",
-                                           code="8",
-                                           code_description="8 o'clock")
-    arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
-                                           domain_name="Clock_Pos",
-                                           code="9",
-                                           code_description="9 o'clock")
-
-
-def wet_weather(feature_layer):
+    return schemaTemplates.check_and_create_domains(geodatabase, WET_WEATHER_PLAN, registry, add_missing_codes=False)
+
+
+def wet_weather(feature_layer, registry=None):
     """
     This adds specific fields required for wet weather inspections
 
@@ -272,6 +53,7 @@ def wet_weather(feature_layer):
     Example: add_gps_fields(r"C:/temp/test.shp")
 
     :param feature_layer: (string) The feature layer (shapefile, feature class, etc) to add the fields to
+    :param registry: (DomainRegistry) Optional registry of geodatabases whose domains are already verified
     :return:
     """
 
@@ -297,9 +79,10 @@ def wet_weather(feature_layer):
         # Check the domains to see if they exist and are valid
         # will update if necessary
 
+        geodatabase = None
         if r'/rest/services' not in arcpy.Describe(feature_layer).catalogPath:
-            geodatabase = get_geodatabase_path(feature_layer)
-            check_and_create_domains(geodatabase)
+            geodatabase = schemaTemplates.get_workspace(desc.catalogPath)
+            check_and_create_domains(geodatabase, registry)
 
         # Add the fields
 
@@ -374,6 +157,139 @@ def wet_weather(feature_layer):
                     feature_layer, field, 'ESRI_POSITIONSOURCETYPE_DOMAIN')
                 continue
 
+        if registry is not None and geodatabase is not None:
+            registry.refresh_stamp(geodatabase)
+
+    except Exception as e:
+        arcpy.AddError("{}\n".format(e))
+        return
+
+
+def compute_inspection_numbers(asset_ids, inspection_dates, existing=None):
+    """
+    Computes the wet weather inspection number of each row
+
+    Rows are put in asset / inspection date order with a single stable sort
+    (ties keep their input order) and each asset's inspections are numbered
+    1, 2, 3... from a group-wise running count
+
+    If existing numbers are passed, rows that already have one keep it and
+    only the unnumbered rows are numbered, continuing on from the highest
+    existing number for that asset
+
+    :param asset_ids: (numpy array) The asset (manhole) ID of each row
+    :param inspection_dates: (numpy array) The inspection date of each row
+    :param existing: (numpy array) Optional current Inspec_Num values, NaN where not set
+    :return: (numpy array) The inspection number of each row
+    """
+    asset_ids = np.asarray(asset_ids)
+    inspection_dates = np.asarray(inspection_dates)
+    numbers = np.full(len(asset_ids), np.nan)
+    if not len(asset_ids):
+        return numbers
+
+    # Swap the IDs for dense integer codes so strings and numbers sort the same way
+    asset_codes = np.unique(asset_ids, return_inverse=True)[1].ravel()
+    start_from = np.zeros(asset_codes.max() + 1)
+
+    if existing is None:
+        pending = np.arange(len(asset_codes))
+    else:
+        existing = np.asarray(existing, dtype='f8')
+        numbered = ~np.isnan(existing)
+        numbers[numbered] = existing[numbered]
+        np.maximum.at(start_from, asset_codes[numbered], existing[numbered])
+        pending = np.flatnonzero(~numbered)
+
+    # lexsort is stable, the last key is the primary sort key
+    order = pending[np.lexsort((inspection_dates[pending], asset_codes[pending]))]
+    sorted_codes = asset_codes[order]
+    positions = np.arange(len(order))
+    group_start = np.ones(len(order), dtype=bool)
+    group_start[1:] = sorted_codes[1:] != sorted_codes[:-1]
+    first_in_group = np.maximum.accumulate(np.where(group_start, positions, 0))
+
+    numbers[order] = start_from[sorted_codes] + (positions - first_in_group) + 1
+    return numbers
+
+
+def number_inspections(feature_layer, asset_field, date_field, incremental=False,
+                       chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """
+    Fills in the Inspec_Num field with a per-asset inspection sequence
+
+    The asset IDs, dates and current numbers are read in chunks into arrays
+    sized from the row count, numbered by compute_inspection_numbers and only
+    rows whose number changed are written back in chunks. Rows with no asset
+    ID or date are left alone.
+
+    Numbering needs every asset and date at once, so unlike the chunked reads
+    and writes its memory is not bounded by chunk_size: it holds about 24
+    bytes a row plus the working arrays of compute_inspection_numbers. Asset
+    IDs are swapped for integer codes as each chunk is read, so their text is
+    never held for the whole table. These arrays are added to the
+    bytes_allocated of stats.
+
+    Example: number_inspections(r"C:/temp/test.gdb/test", "FACILITYID", "Insp_Date")
+
+    :param feature_layer: (string) The feature layer with the wet weather fields
+    :param asset_field: (string) The field holding the asset (manhole) ID
+    :param date_field: (string) The field holding the inspection date
+    :param incremental: (boolean) Keep existing numbers and only number the new inspections
+    :param chunk_size: (int) The number of rows to read or write at a time
+    :param stats: (CursorStats) Optional counters of the rows read and written
+    :return: (int) The number of rows updated
+    """
+
+    try:
+        oid_field = arcpy.Describe(feature_layer).OIDFieldName
+        where_clause = "{} IS NOT NULL AND {} IS NOT NULL".format(
+            arcpy.AddFieldDelimiters(feature_layer, asset_field),
+            arcpy.AddFieldDelimiters(feature_layer, date_field))
+
+        fields = [oid_field, asset_field, date_field, 'Inspec_Num']
+        dtype = get_array_type(feature_layer, fields)[0]
+        row_count = int(arcpy.GetCount_management(feature_layer)[0])
+        oids = np.empty(row_count, dtype=dtype[oid_field])
+        asset_codes = np.empty(row_count, dtype='i4')
+        dates = np.empty(row_count, dtype=dtype[date_field])
+        current = np.empty(row_count, dtype='f8')
+        if stats is not None:
+            stats.bytes_allocated += oids.nbytes + asset_codes.nbytes + dates.nbytes + current.nbytes
+
+        asset_lookup = {}
+        count = 0
+        for chunk in read_chunks(feature_layer, fields, where_clause, chunk_size, stats):
+            if count + len(chunk) > row_count:
+                raise ValueError("{} changed while it was being numbered".format(feature_layer))
+            end = count + len(chunk)
+            unique_ids, inverse = np.unique(chunk[asset_field], return_inverse=True)
+            codes = np.array([asset_lookup.setdefault(asset_id, len(asset_lookup))
+                              for asset_id in unique_ids.tolist()], dtype='i4')
+            asset_codes[count:end] = codes[inverse.ravel()]
+            oids[count:end] = chunk[oid_field]
+            dates[count:end] = chunk[date_field]
+            current[count:end] = chunk['Inspec_Num']
+            count = end
+        if not count:
+            return 0
+
+        oids, current = oids[:count], current[:count]
+        numbers = compute_inspection_numbers(asset_codes[:count],
+                                             dates[:count],
+                                             current if incremental else None)
+
+        changed = (numbers != current) & ~(np.isnan(numbers) & np.isnan(current))
+        updates = np.empty(np.count_nonzero(changed),
+                           dtype=[(oid_field, 'i4'), ('Inspec_Num', 'f8')])
+        updates[oid_field] = oids[changed]
+        updates['Inspec_Num'] = numbers[changed]
+        if stats is not None:
+            stats.bytes_allocated += numbers.nbytes + updates.nbytes
+
+        return update_from_array(feature_layer, updates, oid_field,
+                                 chunk_size=chunk_size, stats=stats)
+
     except Exception as e:
         arcpy.AddError("{}\n".format(e))
         return
@@ -391,6 +307,29 @@ if __name__ == "__main__":
         "Add Wet Weather Fields to Feature Layers")
     parser.add_argument("layers", nargs='+',
                         help="The layers to add fields to")
+    parser.add_argument("--asset-field",
+                        help="Number the inspections of each asset in this ID field")
+    parser.add_argument("--date-field",
+                        help="The inspection date field used to order the numbering")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Keep existing inspection numbers and continue from them")
+    parser.add_argument("--stats", action="store_true",
+                        help="Report the rows read and written, rows per second and memory of the numbering")
+    parser.add_argument("--registry", default=DEFAULT_REGISTRY_PATH,
+                        help="The domain registry file of already verified geodatabases")
+    parser.add_argument("--no-registry", action="store_true",
+                        help="Check the domains of every geodatabase without the registry")
     args = parser.parse_args()
+    if bool(args.asset_field) != bool(args.date_field):
+        parser.error("--asset-field and --date-field must be used together")
+    registry = None if args.no_registry else DomainRegistry(args.registry)
+    stats = CursorStats() if args.stats else None
     for layer in args.layers:
-        wet_weather(layer)
+        wet_weather(layer, registry)
+        if args.asset_field:
+            number_inspections(layer, args.asset_field,
+                               args.date_field, args.incremental, stats=stats)
+    if registry is not None:
+        registry.save()
+    if stats is not None:
+        arcpy.AddMessage(repr(stats))
@@ -0,0 +1,401 @@
+# -*- coding: UTF-8 -*-
+"""
+   Copyright 2020 Aaron J White
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+       http://www.apache.org/licenses/LICENSE-2.0
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.​
+    Benchmarks the schema scripts against synthetic workspaces served by
+    simulated_arcpy and fails if geoprocessing call counts or times go past
+    the stored baselines.
+"""
+import argparse
+import datetime
+import gc
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARK_FOLDER)
+sys.path.insert(1, os.path.dirname(BENCHMARK_FOLDER))
+
+import simulated_arcpy
+simulated_arcpy.install()
+
+import OriginalMetadataFields
+import addWetWeatherFields
+import schemaTemplates
+from chunkedCursor import update_from_array
+from domainRegistry import DomainRegistry
+
+DEFAULT_BASELINES = os.path.join(BENCHMARK_FOLDER, 'baselines.json')
+# CPU time is the least of this many runs of a case, the other results are the same every run
+DEFAULT_REPEATS = 3
+# The number of keys calibrate puts in a dict
+CALIBRATION_SIZE = 20000
+
+# template field type to the type ListFields reports
+FIELD_TYPES = {'SHORT': 'SmallInteger', 'LONG': 'Integer', 'DOUBLE': 'Double',
+               'TEXT': 'String', 'DATE': 'Date'}
+
+
+def new_registry(use_registry):
+    # a registry kept only for the run, stamped from the simulated workspaces
+    if use_registry:
+        return DomainRegistry(None, simulated_arcpy.get_workspace_stamp)
+    return None
+
+
+def run_per_layer(function, use_registry=False):
+    def run(workspace_path, layers):
+        registry = new_registry(use_registry)
+        for layer in layers:
+            function(layer, registry)
+    return run
+
+
+def run_domain_check(function, use_registry=False):
+    def run(workspace_path, layers):
+        registry = new_registry(use_registry)
+        for layer in layers:
+            function(workspace_path, registry)
+    return run
+
+
+def run_templates(use_registry=False):
+    def run(workspace_path, layers):
+        registry = new_registry(use_registry)
+        plan = schemaTemplates.build_plan(['gnss', 'wet_weather'])
+        checked_workspaces = {}
+        for layer in layers:
+            schemaTemplates.apply_plan(layer, plan, checked_workspaces, registry)
+    return run
+
+
+TARGETS = {'add_gnss_fields': run_per_layer(OriginalMetadataFields.add_gnss_fields),
+           'add_gnss_fields+registry': run_per_layer(OriginalMetadataFields.add_gnss_fields, True),
+           'wet_weather': run_per_layer(addWetWeatherFields.wet_weather),
+           'wet_weather+registry': run_per_layer(addWetWeatherFields.wet_weather, True),
+           'gnss.check_and_create_domains': run_domain_check(OriginalMetadataFields.check_and_create_domains),
+           'gnss.check_and_create_domains+registry':
+               run_domain_check(OriginalMetadataFields.check_and_create_domains, True),
+           'wet_weather.check_and_create_domains': run_domain_check(addWetWeatherFields.check_and_create_domains),
+           'wet_weather.check_and_create_domains+registry':
+               run_domain_check(addWetWeatherFields.check_and_create_domains, True),
+           'apply_plan': run_templates(),
+           'apply_plan+registry': run_templates(True)}
+
+
+
+def run_sparse_update(workspace_path, layers):
+    # rewrite the number of every 997th row, the first and the last, then check them
+    for layer in layers:
+        rows = simulated_arcpy._layer(layer).rows
+        oids = list(rows)
+        selected = sorted(set(oids[::997] + oids[-1:]))
+        array = np.empty(len(selected), dtype=[('OBJECTID', 'i4'), ('Inspec_Num', 'f8')])
+        array['OBJECTID'] = selected
+        array['Inspec_Num'] = [-oid for oid in selected]
+        update_from_array(layer, array, 'OBJECTID', chunk_size=ROW_CHUNK_SIZE)
+        selected = set(selected)
+        wrong = [oid for oid in oids if rows[oid]['Inspec_Num'] != (-oid if oid in selected else None)]
+        if wrong:
+            simulated_arcpy.AddError('{} rows updated wrongly, first OID {}'.format(len(wrong), wrong[0]))
+
+
+def run_numbering(workspace_path, layers):
+    # number every inspection, check against a plain sort, then renumber incrementally
+    for layer in layers:
+        rows = simulated_arcpy._layer(layer).rows
+        addWetWeatherFields.number_inspections(layer, 'FACILITYID', 'Insp_Date', chunk_size=ROW_CHUNK_SIZE)
+        expected = {oid: None for oid in rows}
+        inspections = sorted((row['FACILITYID'], row['Insp_Date'], oid) for oid, row in rows.items()
+                             if row['FACILITYID'] is not None and row['Insp_Date'] is not None)
+        for (asset_id, group) in itertools.groupby(inspections, key=lambda inspection: inspection[0]):
+            for number, (_, _, oid) in enumerate(group, 1):
+                expected[oid] = number
+        wrong = [oid for oid in rows if rows[oid]['Inspec_Num'] != expected[oid]]
+        if wrong:
+            simulated_arcpy.AddError('{} inspections numbered wrongly, first OID {}'.format(len(wrong), wrong[0]))
+        updated = addWetWeatherFields.number_inspections(layer, 'FACILITYID', 'Insp_Date', True, ROW_CHUNK_SIZE)
+        if updated:
+            simulated_arcpy.AddError('Renumbering unchanged inspections updated {} rows'.format(updated))
+
+
+# Targets that read and write the rows of one layer instead of its schema
+ROW_TARGETS = {'update_from_array.sparse': run_sparse_update,
+               'number_inspections': run_numbering}
+ROW_CHUNK_SIZE = 10000
+
+SUITES = {'quick': {'layers': (1, 10, 100), 'extra_domains': (0, 100), 'rows': (10000,)},
+          'full': {'layers': (1, 10, 100, 1000), 'extra_domains': (0, 100, 1000), 'rows': (10000, 100000)}}
+SCHEMAS = ('empty', 'partial')
+DOMAIN_STATES = ('none', 'existing')
+# Targets that only touch the workspace domains do not need to vary the layer schema
+DOMAIN_ONLY_TARGETS = ('gnss.check_and_create_domains', 'gnss.check_and_create_domains+registry',
+                       'wet_weather.check_and_create_domains', 'wet_weather.check_and_create_domains+registry')
+
+
+def build_workspace(layers, schema='empty', domains='none', extra_domains=0, codes_per_domain=10):
+    """
+    Makes a synthetic file geodatabase of point layers
+
+    :param layers: (int) The number of point layers
+    :param schema: (string) empty - no template fields, partial - every other
+                   template field without its domain, complete - every template field
+    :param domains: (string) none, or existing - the template domains already exist
+    :param extra_domains: (int) The number of unrelated coded value domains to add
+    :param codes_per_domain: (int) The number of codes in each unrelated domain
+    :return: (tuple) The workspace and the paths of its layers
+    """
+    workspace = simulated_arcpy.Workspace('/benchmark/synthetic.gdb')
+    plan = schemaTemplates.build_plan(list(schemaTemplates.TEMPLATES))
+
+    if domains == 'existing':
+        for name, spec in plan['domains'].items():
+            workspace.domains[name] = simulated_arcpy.Domain(
+                name, spec['domain_type'], spec['field_type'], spec['description'],
+                coded_values=spec.get('coded_values'), value_range=spec.get('range'))
+    for i in range(extra_domains):
+        name = 'Extra_Domain_{}'.format(i)
+        workspace.domains[name] = simulated_arcpy.Domain(
+            name, 'CODED', 'SHORT', coded_values=[(code, str(code)) for code in range(codes_per_domain)])
+
+    fields = list(plan['fields'].values())
+    if schema == 'partial':
+        fields = fields[::2]
+    elif schema == 'empty':
+        fields = []
+
+    paths = []
+    for i in range(layers):
+        path = '{}/layer_{}'.format(workspace.path, i)
+        layer = simulated_arcpy.Layer(path)
+        for spec in fields:
+            layer.fields[spec['name']] = simulated_arcpy.Field(
+                spec['name'], FIELD_TYPES[spec['field_type']], spec['alias'], spec['length'],
+                spec['domain'] if schema == 'complete' else '')
+        workspace.layers[os.path.basename(path)] = layer
+        paths.append(path)
+    return workspace, paths
+
+
+def build_row_workspace(rows, assets=500, seed=0):
+    """
+    Makes a synthetic file geodatabase with one layer of wet weather inspections
+
+    About one in twenty rows has no asset ID or no date, and the OIDs have
+    gaps as if rows had been deleted.
+
+    :param rows: (int) The number of rows in the layer
+    :param assets: (int) The number of distinct asset IDs
+    :param seed: (int) Seeds the random asset IDs, dates and gaps
+    :return: (tuple) The workspace and a list holding the path of its layer
+    """
+    generator = random.Random(seed)
+    workspace = simulated_arcpy.Workspace('/benchmark/rows.gdb')
+    path = '{}/inspections'.format(workspace.path)
+    layer = simulated_arcpy.Layer(path)
+    layer.fields['FACILITYID'] = simulated_arcpy.Field('FACILITYID', 'String', 'Facility ID', 20)
+    layer.fields['Insp_Date'] = simulated_arcpy.Field('Insp_Date', 'Date', 'Inspection Date')
+    layer.fields['Inspec_Num'] = simulated_arcpy.Field('Inspec_Num', 'Double', 'Inspection Number')
+
+    start = datetime.datetime(2015, 1, 1)
+    oid = 0
+    for _ in range(rows):
+        oid += 1 if generator.random() < 0.9 else generator.randint(2, 50)
+        asset_id = 'MH-{:05d}'.format(generator.randrange(assets)) if generator.random() > 0.03 else None
+        date = start + datetime.timedelta(minutes=generator.randrange(5000000)) \
+            if generator.random() > 0.02 else None
+        layer.rows[oid] = {'OBJECTID': oid, 'FACILITYID': asset_id, 'Insp_Date': date, 'Inspec_Num': None}
+    workspace.layers[os.path.basename(path)] = layer
+    return workspace, [path]
+
+
+def case_name(target, layers, schema, domains, extra_domains):
+    return '{}/layers={}/schema={}/domains={}/extra_domains={}'.format(
+        target, layers, schema, domains, extra_domains)
+
+
+def row_case_name(target, rows):
+    return '{}/rows={}'.format(target, rows)
+
+
+def run_case(target, layers, schema, domains, extra_domains, repeats=DEFAULT_REPEATS):
+    """
+    Runs one target against a fresh synthetic workspace
+
+    :return: (dict) The call counts, simulated latency and CPU time of the run
+    """
+    return measure(TARGETS[target], lambda: build_workspace(layers, schema, domains, extra_domains), repeats)
+
+
+def run_row_case(target, rows, repeats=DEFAULT_REPEATS):
+    """
+    Runs one row target against a fresh layer of inspections
+
+    :return: (dict) The call counts, simulated latency and CPU time of the run
+    """
+    return measure(ROW_TARGETS[target], lambda: build_row_workspace(rows), repeats)
+
+
+def calibrate():
+    """
+    Times a fixed amount of the dict and string work the scripts do
+
+    :return: (float) The CPU seconds taken
+    """
+    gc.collect()
+    start = time.process_time()
+    lookup = {}
+    for i in range(CALIBRATION_SIZE):
+        lookup['{:05d}'.format(i)] = i
+    sum(lookup.values())
+    return time.process_time() - start
+
+
+def measure(run, build, repeats):
+    """
+    Runs a target repeats times, each against a newly built workspace
+
+    The CPU time of one run changes by half or more with whatever else the
+    machine is doing, so each result keeps the least CPU time of its runs
+    and the least time calibrate took just before them. compare scales the
+    baseline CPU time by the change in calibration time.
+
+    :param run: (function) The target, called with the workspace path and layer paths
+    :param build: (function) Returns a new workspace and its layer paths
+    :param repeats: (int) The number of runs
+    :return: (dict) The results of the first run with the least CPU and calibration times
+    """
+    result = None
+    for _ in range(max(repeats, 1)):
+        workspace, paths = build()
+        simulated_arcpy.reset([workspace])
+        calibration_seconds = round(calibrate(), 6)
+        gc.collect()
+        start = time.process_time()
+        run(workspace.path, paths)
+        cpu_seconds = round(time.process_time() - start, 6)
+        if result is None:
+            result = {'calls': sum(simulated_arcpy.calls.values()),
+                      'call_counts': dict(sorted(simulated_arcpy.calls.items())),
+                      'simulated_seconds': round(simulated_arcpy.simulated_seconds, 6),
+                      'cpu_seconds': cpu_seconds,
+                      'calibration_seconds': calibration_seconds,
+                      'errors': sum(1 for message in simulated_arcpy.messages
+                                    if message[0].startswith('ERROR'))}
+        result['cpu_seconds'] = min(result['cpu_seconds'], cpu_seconds)
+        result['calibration_seconds'] = min(result['calibration_seconds'], calibration_seconds)
+    return result
+
+
+def compare(name, result, baseline, time_tolerance, time_floor):
+    """
+    Compares a result with its baseline
+
+    Call counts, simulated latency and errors are deterministic so any
+    increase fails, a target that starts failing early makes fewer calls.
+    CPU time fails when it is more than time_tolerance (a fraction) and
+    time_floor seconds over the baseline, after scaling the baseline by how
+    much slower calibrate ran (see measure). A machine that is faster than
+    when the baselines were stored does not tighten the limit.
+
+    :return: (list) The regressions found
+    """
+    regressions = []
+    if result['errors'] > baseline['errors']:
+        regressions.append('{}: {} errors, baseline {}'.format(name, result['errors'], baseline['errors']))
+    if result['calls'] > baseline['calls']:
+        regressions.append('{}: {} calls, baseline {}'.format(name, result['calls'], baseline['calls']))
+    if result['simulated_seconds'] > baseline['simulated_seconds'] + 1e-6:
+        regressions.append('{}: {:.3f}s simulated, baseline {:.3f}s'.format(
+            name, result['simulated_seconds'], baseline['simulated_seconds']))
+    scale = 1.0
+    if baseline.get('calibration_seconds') and result.get('calibration_seconds'):
+        scale = max(result['calibration_seconds'] / baseline['calibration_seconds'], 1.0)
+    expected = baseline['cpu_seconds'] * scale
+    allowed = max(expected * (1 + time_tolerance), expected + time_floor)
+    if result['cpu_seconds'] > allowed:
+        regressions.append('{}: {:.3f}s CPU, baseline {:.3f}s scaled to {:.3f}s'.format(
+            name, result['cpu_seconds'], baseline['cpu_seconds'], expected))
+    return regressions
+
+
+def run_suite(suite, targets, repeats=DEFAULT_REPEATS):
+    results = {}
+    for target in targets:
+        if target in ROW_TARGETS:
+            cases = [(row_case_name(target, rows), run_row_case, (target, rows, repeats))
+                     for rows in SUITES[suite]['rows']]
+        else:
+            schemas = SCHEMAS[:1] if target in DOMAIN_ONLY_TARGETS else SCHEMAS
+            cases = [(case_name(target, *parameters), run_case, (target,) + parameters + (repeats,))
+                     for parameters in itertools.product(SUITES[suite]['layers'], schemas, DOMAIN_STATES,
+                                                         SUITES[suite]['extra_domains'])]
+        for name, run, parameters in cases:
+            results[name] = run(*parameters)
+            print('{:<95} {:>7} calls {:>10.3f}s simulated {:>8.3f}s CPU {:>5} errors'.format(
+                name, results[name]['calls'], results[name]['simulated_seconds'],
+                results[name]['cpu_seconds'], results[name]['errors']))
+    return results
+
+
+if __name__ == "__main__":
+    """
+        Commandline use to run the benchmarks
+
+        Example: python benchmarks/run_benchmarks.py --suite full
+                 python benchmarks/run_benchmarks.py --update-baselines
+    """
+    parser = argparse.ArgumentParser("Benchmark the Schema Scripts")
+    parser.add_argument("--suite", choices=list(SUITES), default='quick',
+                        help="The set of workspace sizes to run")
+    parser.add_argument("--target", action="append", dest="targets", choices=list(TARGETS) + list(ROW_TARGETS),
+                        help="Only run this target, can be repeated")
+    parser.add_argument("--baselines", default=DEFAULT_BASELINES,
+                        help="The JSON file of baseline results")
+    parser.add_argument("--update-baselines", action="store_true",
+                        help="Store these results as the new baselines")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS,
+                        help="The number of runs of each case to take the least CPU time of")
+    parser.add_argument("--time-tolerance", type=float, default=1.0,
+                        help="The fraction CPU time may rise over its baseline")
+    parser.add_argument("--time-floor", type=float, default=0.05,
+                        help="The CPU seconds a case may rise over its baseline regardless of tolerance")
+    args = parser.parse_args()
+
+    results = run_suite(args.suite, args.targets or sorted(TARGETS) + sorted(ROW_TARGETS), args.repeats)
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as baseline_file:
+            baselines = json.load(baseline_file)
+
+    if args.update_baselines:
+        baselines.update(results)
+        with open(args.baselines, 'w') as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+        print('Stored {} baselines in {}'.format(len(results), args.baselines))
+        sys.exit(0)
+
+    regressions = []
+    for name, result in results.items():
+        if name in baselines:
+            regressions.extend(compare(name, result, baselines[name], args.time_tolerance, args.time_floor))
+        else:
+            print('No baseline for {}'.format(name))
+    for regression in regressions:
+        print('REGRESSION {}'.format(regression))
+    sys.exit(1 if regressions else 0)
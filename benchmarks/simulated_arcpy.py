@@ -0,0 +1,335 @@
+# -*- coding: UTF-8 -*-
+"""
+   Copyright 2020 Aaron J White
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+       http://www.apache.org/licenses/LICENSE-2.0
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.​
+    A stand-in for the parts of arcpy the scripts use, backed by in-memory
+    workspaces. Every geoprocessing call is counted and charged a simulated
+    latency so the benchmarks can run without ArcGIS Pro.
+"""
+import bisect
+import collections
+import os
+import re
+import sys
+import types
+
+# Rough cost of each call in seconds against a file geodatabase, the schema
+# changing tools take a schema lock and are much slower than the reads
+LATENCY = {'Describe': 0.005,
+           'ListFields': 0.01,
+           'ListDomains': 0.02,
+           'AddField_management': 0.15,
+           'AddFields_management': 0.2,
+           'CreateDomain_management': 0.1,
+           'AddCodedValueToDomain_management': 0.04,
+           'SetValueForRangeDomain_management': 0.04,
+           'AssignDomainToField_management': 0.08,
+           'GetCount_management': 0.01,
+           'SearchCursor': 0.01,
+           'UpdateCursor': 0.02,
+           # each row a cursor returns, and each row it writes
+           'CursorRow': 0.00001,
+           'updateRow': 0.0001}
+# Extra cost of ListDomains per coded value or range it returns
+LATENCY_PER_DOMAIN_VALUE = 0.00005
+
+calls = collections.Counter()
+simulated_seconds = 0.0
+messages = []
+workspaces = {}
+
+
+class Domain(object):
+    def __init__(self, name, domain_type, field_type='SHORT', description='', coded_values=None, value_range=None):
+        self.name = name
+        self.domainType = 'CodedValue' if domain_type == 'CODED' else 'Range'
+        self.type = field_type
+        self.description = description
+        self.codedValues = dict(coded_values or {})
+        self.range = list(value_range) if value_range else [0, 0]
+
+
+class Field(object):
+    def __init__(self, name, field_type, alias='', length=None, domain=''):
+        self.name = name
+        self.type = field_type
+        self.aliasName = alias or name
+        self.length = length or 0
+        self.domain = domain or ''
+
+
+class Layer(object):
+    def __init__(self, catalog_path, shape_type='Point'):
+        self.catalogPath = catalog_path
+        self.dataType = 'FeatureClass'
+        self.shapeType = shape_type
+        self.OIDFieldName = 'OBJECTID'
+        self.fields = collections.OrderedDict([('OBJECTID', Field('OBJECTID', 'OID')),
+                                               ('Shape', Field('Shape', 'Geometry'))])
+        # OBJECTID to a dict of field name to value
+        self.rows = collections.OrderedDict()
+
+
+class Cursor(object):
+    """
+    A search or update cursor over the rows of a simulated layer
+
+    Every row returned is counted as a CursorRow call, so a query that reads
+    more of the table than it needs shows up in the call counts.
+    """
+
+    def __init__(self, name, in_table, field_names, where_clause=None):
+        _call(name)
+        layer = _layer(in_table)
+        self._fields = [layer.OIDFieldName if field == 'OID@' else field for field in field_names]
+        for field in self._fields:
+            if field not in layer.fields:
+                raise RuntimeError("Cannot find field '{}'".format(field))
+        oid_ranges = _oid_ranges(where_clause, layer.OIDFieldName)
+        if oid_ranges is None:
+            test = _where_function(where_clause)
+            self._rows = (row for row in layer.rows.values() if test(row))
+        else:
+            # like an OBJECTID index, only the rows selected are visited
+            oids = sorted(layer.rows)
+            self._rows = (layer.rows[oid] for first, last in oid_ranges
+                          for oid in oids[bisect.bisect_left(oids, first):bisect.bisect_right(oids, last)])
+        self._row = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._rows = iter(())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self._row = next(self._rows)
+        _call('CursorRow')
+        return tuple(self._row.get(field) for field in self._fields)
+
+    def updateRow(self, values):
+        _call('updateRow')
+        self._row.update(zip(self._fields, values))
+
+
+# SQL words in the where clauses the scripts build, and their Python equivalents
+SQL_WORDS = {'AND': 'and', 'OR': 'or', 'IN': 'in', 'IS': 'is', 'NOT': 'not', 'NULL': 'None'}
+
+
+def _oid_ranges(where_clause, oid_field):
+    """
+    The sorted OBJECTID ranges a where clause of only OBJECTID IN lists and
+    ranges joined by OR selects, or None for any other where clause
+    """
+    if not where_clause:
+        return None
+    pattern = r'{0} IN \(([0-9, ]+)\)|\({0} >= ([0-9]+) AND {0} <= ([0-9]+)\)'.format(re.escape(oid_field))
+    ranges = []
+    for term in where_clause.split(' OR '):
+        match = re.fullmatch(pattern, term)
+        if match is None:
+            return None
+        if match.group(1):
+            ranges.extend((int(oid), int(oid)) for oid in match.group(1).split(','))
+        else:
+            ranges.append((int(match.group(2)), int(match.group(3))))
+    return sorted(ranges)
+
+
+def _where_function(where_clause):
+    """
+    Turns a where clause into a test of a row dict
+
+    Only handles the field comparisons, IS [NOT] NULL, IN lists, AND and OR
+    that the scripts build, not quoted strings.
+    """
+    if not where_clause:
+        return lambda row: True
+    expression = re.sub(r'[A-Za-z_][A-Za-z_0-9]*',
+                        lambda match: SQL_WORDS.get(match.group(0), 'row[{!r}]'.format(match.group(0))),
+                        where_clause)
+    # IN lists as sets, so long lists of OIDs stay quick to test
+    expression = re.sub(r'\bin \(([^)]*)\)', r'in {\1}', expression)
+    return eval('lambda row: ' + expression)
+
+
+class Workspace(object):
+    def __init__(self, path):
+        self.path = path
+        self.domains = collections.OrderedDict()
+        self.layers = collections.OrderedDict()
+        # bumped by every domain or field change, stands in for the modification time of the catalog
+        self.version = 0
+
+
+def reset(new_workspaces):
+    """
+    Replaces the simulated workspaces and clears the call counters
+
+    :param new_workspaces: (list) The Workspace objects to serve
+    :return:
+    """
+    global simulated_seconds
+    workspaces.clear()
+    workspaces.update((workspace.path, workspace) for workspace in new_workspaces)
+    calls.clear()
+    simulated_seconds = 0.0
+    del messages[:]
+
+
+def install():
+    """
+    Makes "import arcpy" load this module
+
+    :return:
+    """
+    sys.modules['arcpy'] = sys.modules[__name__]
+
+
+def get_workspace_stamp(path):
+    """
+    Stamps a simulated workspace for domainRegistry.DomainRegistry
+
+    :param path: (string) The workspace path
+    :return: (string) The stamp, or None if the workspace does not exist
+    """
+    return str(workspaces[path].version) if path in workspaces else None
+
+
+def _call(name, extra_seconds=0.0):
+    global simulated_seconds
+    calls[name] += 1
+    simulated_seconds += LATENCY[name] + extra_seconds
+
+
+def _layer(path):
+    workspace = workspaces.get(os.path.dirname(path))
+    if workspace is None or os.path.basename(path) not in workspace.layers:
+        raise IOError("{} does not exist".format(path))
+    return workspace.layers[os.path.basename(path)]
+
+
+def _touch(path):
+    workspaces[os.path.dirname(path)].version += 1
+
+
+def _workspace(path):
+    if path not in workspaces:
+        raise IOError("{} does not exist".format(path))
+    return workspaces[path]
+
+
+def Describe(path):
+    _call('Describe')
+    return _layer(path)
+
+
+def ListFields(path):
+    _call('ListFields')
+    return list(_layer(path).fields.values())
+
+
+def _list_domains(path):
+    domains = list(_workspace(path).domains.values())
+    values = sum(len(domain.codedValues) or 2 for domain in domains)
+    _call('ListDomains', values * LATENCY_PER_DOMAIN_VALUE)
+    return domains
+
+
+da = types.SimpleNamespace(
+    ListDomains=_list_domains,
+    SearchCursor=lambda in_table, field_names, where_clause=None:
+        Cursor('SearchCursor', in_table, field_names, where_clause),
+    UpdateCursor=lambda in_table, field_names, where_clause=None:
+        Cursor('UpdateCursor', in_table, field_names, where_clause))
+
+
+def GetCount_management(in_rows):
+    _call('GetCount_management')
+    return [str(len(_layer(in_rows).rows))]
+
+
+def AddFieldDelimiters(datasource, field):
+    return field
+
+
+def AddField_management(in_table, field_name, field_type, field_precision=None, field_scale=None,
+                        field_length=None, field_alias=None, field_is_nullable=None,
+                        field_is_required=None, field_domain=None):
+    _call('AddField_management')
+    layer = _layer(in_table)
+    if field_name in layer.fields:
+        raise ValueError("Field {} already exists".format(field_name))
+    layer.fields[field_name] = Field(field_name, field_type, field_alias, field_length, field_domain)
+    _touch(in_table)
+
+
+def AddFields_management(in_table, field_description):
+    _call('AddFields_management')
+    layer = _layer(in_table)
+    for name, field_type, alias, length, default, domain in field_description:
+        if name in layer.fields:
+            raise ValueError("Field {} already exists".format(name))
+        layer.fields[name] = Field(name, field_type, alias, length or None, domain)
+    _touch(in_table)
+
+
+def CreateDomain_management(in_workspace, domain_name, domain_description='', field_type='SHORT',
+                            domain_type='CODED', split_policy=None, merge_policy=None):
+    _call('CreateDomain_management')
+    workspace = _workspace(in_workspace)
+    if domain_name in workspace.domains:
+        raise ValueError("Domain {} already exists".format(domain_name))
+    workspace.domains[domain_name] = Domain(domain_name, domain_type, field_type, domain_description)
+    workspace.version += 1
+
+
+def AddCodedValueToDomain_management(in_workspace, domain_name, code, code_description):
+    _call('AddCodedValueToDomain_management')
+    workspace = _workspace(in_workspace)
+    domain = workspace.domains[domain_name]
+    if domain.type in ('SHORT', 'LONG'):
+        code = int(code)
+    domain.codedValues[code] = code_description
+    workspace.version += 1
+
+
+def SetValueForRangeDomain_management(in_workspace, domain_name, min_value, max_value):
+    _call('SetValueForRangeDomain_management')
+    workspace = _workspace(in_workspace)
+    workspace.domains[domain_name].range = [min_value, max_value]
+    workspace.version += 1
+
+
+def AssignDomainToField_management(in_table, field_name, domain_name, subtype_code=None):
+    _call('AssignDomainToField_management')
+    name = getattr(field_name, 'name', field_name)
+    _layer(in_table).fields[name].domain = domain_name
+    _touch(in_table)
+
+
+def AddMessage(message):
+    messages.append(('MESSAGE', message))
+
+
+def AddWarning(message):
+    messages.append(('WARNING', message))
+
+
+def AddError(message):
+    messages.append(('ERROR', message))
+
+
+def AddIDMessage(message_type, *args):
+    messages.append((message_type, args))
@@ -0,0 +1,252 @@
+# -*- coding: UTF-8 -*-
+"""
+   Copyright 2020 Aaron J White
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+       http://www.apache.org/licenses/LICENSE-2.0
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.​
+    Shared chunked reading and writing of feature class attributes as NumPy
+    structured arrays, so memory stays proportional to the chunk size rather
+    than the number of rows.
+"""
+import arcpy
+import itertools
+import numpy as np
+import time
+
+DEFAULT_CHUNK_SIZE = 50000
+# OBJECTIDs further apart than this are updated through separate ranges
+MAX_OID_GAP = 10
+# The most ranges or IN values in one update cursor's where clause
+MAX_WHERE_TERMS = 1000
+
+# field type: (dtype, value stored for nulls)
+COLUMN_TYPES = {'OID': ('i4', -1),
+                'SmallInteger': ('i2', -32768),
+                'Integer': ('i4', -2147483648),
+                'Single': ('f4', np.nan),
+                'Double': ('f8', np.nan),
+                'Date': ('datetime64[ms]', np.datetime64('NaT', 'ms')),
+                'GUID': ('U38', ''),
+                'GlobalID': ('U38', '')}
+
+TOKEN_TYPES = {'OID@': ('i4', -1),
+               'SHAPE@X': ('f8', np.nan),
+               'SHAPE@Y': ('f8', np.nan),
+               'SHAPE@Z': ('f8', np.nan)}
+
+
+class CursorStats(object):
+    """
+    Counts the rows moved and buffer memory allocated by the chunked cursors
+
+    One instance can be passed to several reads and writes to total them.
+    Stages that also hold arrays sized by the row count add those to
+    bytes_allocated.
+    """
+
+    def __init__(self):
+        self.rows_read = 0
+        self.rows_written = 0
+        self.chunks = 0
+        self.bytes_allocated = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        rows = self.rows_read + self.rows_written
+        return rows / self.seconds if self.seconds else 0.0
+
+    def merge(self, other):
+        """
+        Adds the counters of another instance, like one filled in a worker process
+
+        :param other: (CursorStats) The counters to add
+        :return:
+        """
+        self.rows_read += other.rows_read
+        self.rows_written += other.rows_written
+        self.chunks += other.chunks
+        self.bytes_allocated += other.bytes_allocated
+        self.seconds += other.seconds
+
+    def __repr__(self):
+        return "CursorStats(rows_read={}, rows_written={}, chunks={}, bytes_allocated={}, rows_per_second={:.0f})".format(
+            self.rows_read, self.rows_written, self.chunks, self.bytes_allocated, self.rows_per_second)
+
+
+def get_array_type(table, fields):
+    """
+    Works out the structured array type and null values for a list of fields
+
+    Nulls can not be held in NumPy integer, string or date arrays, so each
+    field has a stand-in value: NaN for floats, NaT for dates, '' for strings
+    and the lowest value of the type for integers. A real '' or lowest
+    integer can not be told apart from a null once read, and update_from_array
+    writes both back as null.
+
+    :param table: (string) The table or feature layer
+    :param fields: (list) The field names, OID@ and SHAPE@X/Y/Z tokens are allowed
+    :return: (tuple) The numpy dtype and a list of the null value of each field
+    """
+    table_fields = dict((field.name, field) for field in arcpy.ListFields(table))
+    dtype = []
+    null_values = []
+    for name in fields:
+        if name in TOKEN_TYPES:
+            field_dtype, null_value = TOKEN_TYPES[name]
+        elif name not in table_fields:
+            raise ValueError("{} is not a field of {}".format(name, table))
+        elif table_fields[name].type == 'String':
+            field_dtype, null_value = 'U{}'.format(max(table_fields[name].length, 1)), ''
+        elif table_fields[name].type in COLUMN_TYPES:
+            field_dtype, null_value = COLUMN_TYPES[table_fields[name].type]
+        else:
+            raise ValueError("{} fields like {} can not be read into arrays".format(
+                table_fields[name].type, name))
+        dtype.append((name, field_dtype))
+        null_values.append(null_value)
+    return np.dtype(dtype), null_values
+
+
+def read_chunks(table, fields, where_clause=None, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """
+    Reads the rows of a table as structured arrays of at most chunk_size rows
+
+    The same buffer is filled for every chunk, so each yielded array is only
+    valid until the next one is read. Copy it to keep it.
+
+    Example: for chunk in read_chunks(r"C:/temp/test.gdb/test", ['OID@', 'ESRIGNSS_H_RMS']):
+
+    :param table: (string) The table or feature layer to read
+    :param fields: (list) The field names, OID@ and SHAPE@X/Y/Z tokens are allowed
+    :param where_clause: (string) Optional SQL filter of the rows to read
+    :param chunk_size: (int) The number of rows in each chunk
+    :param stats: (CursorStats) Optional counters to add to
+    :return: (generator) Structured arrays, nulls replaced as in get_array_type
+    """
+    dtype, null_values = get_array_type(table, fields)
+    buffer = np.empty(chunk_size, dtype=dtype)
+    if stats is not None:
+        stats.bytes_allocated += buffer.nbytes
+
+    with arcpy.da.SearchCursor(table, fields, where_clause=where_clause) as cursor:
+        while True:
+            start = time.perf_counter()
+            count = 0
+            for row in itertools.islice(cursor, chunk_size):
+                if None in row:
+                    row = tuple(null_values[i] if value is None else value for i, value in enumerate(row))
+                buffer[count] = row
+                count += 1
+            if stats is not None:
+                stats.seconds += time.perf_counter() - start
+                stats.rows_read += count
+                stats.chunks += 1 if count else 0
+            if not count:
+                break
+            yield buffer[:count]
+
+
+def is_null(values, null_value):
+    """
+    Finds the nulls in an array read by read_chunks
+
+    :param values: (numpy array) One field of a chunk
+    :param null_value: (any) The field's null value from get_array_type
+    :return: (numpy array) True where the value is null
+    """
+    if values.dtype.kind in 'fM':
+        return np.isnan(values) if values.dtype.kind == 'f' else np.isnat(values)
+    return values == null_value
+
+
+def get_oid_where_clauses(delimited_oid, oids, max_gap=MAX_OID_GAP, max_terms=MAX_WHERE_TERMS):
+    """
+    Builds where clauses that select a sorted list of OBJECTIDs
+
+    The OBJECTIDs are split into runs wherever two are more than max_gap
+    apart. Runs are selected as ranges and lone OBJECTIDs with IN, so a query
+    never reads more than max_gap rows for each row wanted however far apart
+    the OBJECTIDs are.
+
+    :param delimited_oid: (string) The delimited OBJECTID field name
+    :param oids: (numpy array) The sorted OBJECTIDs
+    :param max_gap: (int) The largest gap between OBJECTIDs in one range
+    :param max_terms: (int) The most ranges or IN values in one clause
+    :return: (generator) The where clauses
+    """
+    breaks = np.flatnonzero(np.diff(oids) > max_gap) + 1
+    firsts = oids[np.concatenate(([0], breaks))].tolist()
+    lasts = oids[np.concatenate((breaks - 1, [len(oids) - 1]))].tolist()
+    for start in range(0, len(firsts), max_terms):
+        runs = list(zip(firsts[start:start + max_terms], lasts[start:start + max_terms]))
+        terms = ["({0} >= {1} AND {0} <= {2})".format(delimited_oid, first, last)
+                 for first, last in runs if first != last]
+        singles = [str(first) for first, last in runs if first == last]
+        if singles:
+            terms.insert(0, "{} IN ({})".format(delimited_oid, ', '.join(singles)))
+        yield ' OR '.join(terms)
+
+
+def update_from_array(table, array, oid_field, fields=None, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """
+    Writes the values in a structured array back to the rows with the same OBJECTID
+
+    The array is sorted by OBJECTID and written in chunks of at most
+    chunk_size rows. Each chunk selects its rows with the where clauses of
+    get_oid_where_clauses, so a sparse update reads at most MAX_OID_GAP rows
+    for each row it writes rather than every row between its lowest and
+    highest OBJECTID.
+
+    Null values (see get_array_type) are written as nulls, including a real
+    '' or lowest integer read by read_chunks.
+
+    Example: update_from_array(r"C:/temp/test.gdb/test", numbers, 'OBJECTID', ['Inspec_Num'])
+
+    :param table: (string) The table or feature layer to update
+    :param array: (numpy structured array) The OBJECTIDs and new values
+    :param oid_field: (string) The name of the OBJECTID field in the array
+    :param fields: (list) The fields of the array to write, all but the OBJECTID field if not given
+    :param chunk_size: (int) The number of rows to update with each cursor
+    :param stats: (CursorStats) Optional counters to add to
+    :return: (int) The number of rows updated
+    """
+    if fields is None:
+        fields = [name for name in array.dtype.names if name != oid_field]
+    if not len(array) or not fields:
+        return 0
+
+    array = array[np.argsort(array[oid_field], kind='stable')]
+    null_values = get_array_type(table, fields)[1]
+    delimited_oid = arcpy.AddFieldDelimiters(table, arcpy.Describe(table).OIDFieldName)
+    updated = 0
+
+    for start in range(0, len(array), chunk_size):
+        begin = time.perf_counter()
+        chunk = array[start:start + chunk_size]
+        oids = chunk[oid_field]
+        nulls = [is_null(chunk[name], null_value) for name, null_value in zip(fields, null_values)]
+        values = [chunk[name].tolist() for name in fields]
+
+        for where_clause in get_oid_where_clauses(delimited_oid, oids):
+            with arcpy.da.UpdateCursor(table, ['OID@'] + list(fields), where_clause=where_clause) as cursor:
+                for row in cursor:
+                    index = np.searchsorted(oids, row[0])
+                    if index == len(oids) or oids[index] != row[0]:
+                        continue
+                    cursor.updateRow([row[0]] + [None if nulls[i][index] else values[i][index]
+                                                 for i in range(len(fields))])
+                    updated += 1
+
+        if stats is not None:
+            stats.seconds += time.perf_counter() - begin
+            stats.chunks += 1
+    if stats is not None:
+        stats.rows_written += updated
+    return updated
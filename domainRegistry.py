@@ -0,0 +1,225 @@
+# -*- coding: UTF-8 -*-
+"""
+   Copyright 2020 Aaron J White
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+       http://www.apache.org/licenses/LICENSE-2.0
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.​
+    A local registry of the canonical domain definitions and of the
+    geodatabases they have already been verified against, so unchanged
+    geodatabases do not need their domains listed and checked on every run.
+"""
+import arcpy
+import hashlib
+import json
+import os
+import tempfile
+
+from schemaTemplates import TEMPLATES
+
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.expanduser('~'), '.arcgis_pro_scripts', 'domain_registry.json')
+# The file name of a file geodatabase's GDB_Items system table, which holds its domain definitions
+GDB_ITEMS_TABLE = 'a00000004'
+
+
+def get_canonical_definitions():
+    """
+    Gets the domain definitions of every template by name
+
+    :return: (dict) Domain name to its template definition
+    """
+    definitions = {}
+    for template in TEMPLATES.values():
+        for spec in template['domains']:
+            definitions[spec['name']] = spec
+    return definitions
+
+
+def get_definition_hash(spec):
+    """
+    Gets a content hash of a domain definition
+
+    :param spec: (dict) The domain definition
+    :return: (string) The SHA-256 hex digest of the definition
+    """
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_workspace_stamp(workspace):
+    """
+    Gets a modification stamp for a geodatabase
+
+    File geodatabases are stamped with the newest modification time and total
+    size of their GDB_Items system table files, the catalog that holds the
+    domain definitions, so editing feature data does not count as a change.
+    Adding fields writes the same catalog, see DomainRegistry.refresh_stamp.
+    File geodatabases without the table are stamped from all of their files,
+    ignoring the .lock files that opening them creates. Personal geodatabases
+    use the .mdb file's modification time. Enterprise geodatabases can not be
+    stamped from the file system.
+
+    :param workspace: (string) The path to the geodatabase
+    :return: (string) The stamp, or None if the geodatabase can not be stamped
+    """
+    if os.path.isdir(workspace):
+        entries = [entry for entry in os.scandir(workspace) if not entry.name.endswith('.lock')]
+        catalog = [entry for entry in entries if entry.name.startswith(GDB_ITEMS_TABLE + '.')]
+        stats = [entry.stat() for entry in catalog or entries]
+        return '{}:{}:{}'.format(max([stat.st_mtime_ns for stat in stats] + [0]),
+                                 sum(stat.st_size for stat in stats), len(stats))
+    if os.path.splitext(workspace)[1].lower() == '.mdb' and os.path.isfile(workspace):
+        return str(os.stat(workspace).st_mtime_ns)
+    return None
+
+
+def read_workspaces(path):
+    """
+    Reads the verified workspaces from a registry file
+
+    A registry is only a cache, so a file that can not be read or parsed, or
+    a workspace entry without a stamp and hashes, is dropped with a warning
+    and those workspaces are checked again.
+
+    :param path: (string) The registry file
+    :return: (dict) Workspace key to its stamp and domain hashes
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as registry_file:
+            workspaces = json.load(registry_file).get('workspaces', {})
+        if not isinstance(workspaces, dict):
+            raise ValueError("workspaces is not an object")
+    except (IOError, OSError, ValueError, AttributeError) as e:
+        arcpy.AddWarning("Ignoring the domain registry {}, it could not be read: {}".format(path, e))
+        return {}
+
+    valid = dict((key, entry) for key, entry in workspaces.items()
+                 if isinstance(entry, dict) and isinstance(entry.get('hashes'), dict)
+                 and (entry.get('stamp') is None or isinstance(entry.get('stamp'), str)))
+    if len(valid) < len(workspaces):
+        arcpy.AddWarning("Ignoring {} malformed workspaces in the domain registry {}".format(
+            len(workspaces) - len(valid), path))
+    return valid
+
+
+class DomainRegistry(object):
+    """
+    Canonical domain definitions and the workspaces verified against them
+
+    A workspace counts as verified when it was checked in this run, or when
+    its stamp and the hashes of the domains it was checked for have not
+    changed since it was recorded.
+
+    The stamp is taken when the domains are checked and again by
+    refresh_stamp once the caller's own field changes are done, as those
+    change the catalog the stamp covers (see get_workspace_stamp).
+    """
+
+    def __init__(self, path=DEFAULT_REGISTRY_PATH, stamp_function=get_workspace_stamp):
+        """
+        :param path: (string) The registry file, None to only keep the registry for this run
+        :param stamp_function: (function) Gets the modification stamp of a workspace path
+        """
+        self.path = path
+        self.stamp_function = stamp_function
+        self.definitions = get_canonical_definitions()
+        self.hashes = dict((name, get_definition_hash(spec)) for name, spec in self.definitions.items())
+        self.workspaces = read_workspaces(path)
+        self._verified_this_run = {}
+
+    def is_verified(self, workspace, domain_names):
+        """
+        Checks if a workspace's domains are known to match the definitions
+
+        :param workspace: (string) The path to the geodatabase
+        :param domain_names: (list) The domains the caller needs
+        :return: (boolean) True if the domains do not need to be checked
+        """
+        key = self._key(workspace)
+        if set(domain_names).issubset(self._verified_this_run.get(key, ())):
+            return True
+
+        entry = self.workspaces.get(key)
+        if entry is None or entry['stamp'] is None:
+            return False
+        if any(entry['hashes'].get(name) != self.hashes.get(name) for name in domain_names):
+            return False
+        if entry['stamp'] != self.stamp_function(workspace):
+            return False
+
+        self._verified_this_run.setdefault(key, set()).update(domain_names)
+        return True
+
+    def mark_verified(self, workspace, domain_names):
+        """
+        Records that a workspace's domains were checked or created
+
+        :param workspace: (string) The path to the geodatabase
+        :param domain_names: (list) The domains that were checked
+        :return:
+        """
+        key = self._key(workspace)
+        verified = self._verified_this_run.setdefault(key, set())
+        verified.update(domain_names)
+        stamp = self.stamp_function(workspace)
+        entry = self.workspaces.get(key)
+        # A new stamp only vouches for the domains checked in this run
+        if entry is None or entry['stamp'] != stamp:
+            entry = self.workspaces[key] = {'stamp': stamp, 'hashes': {}}
+        entry['hashes'].update((name, self.hashes.get(name)) for name in verified)
+
+    def refresh_stamp(self, workspace):
+        """
+        Re-stamps a workspace checked in this run once the caller's schema changes are done
+
+        Adding fields and assigning domains write the catalog the stamp is
+        taken from, so without this the next run would always find the
+        workspace changed. Changes other programs make between the domain
+        check and this call are taken as the caller's own.
+
+        :param workspace: (string) The path to the geodatabase
+        :return:
+        """
+        key = self._key(workspace)
+        entry = self.workspaces.get(key)
+        if key in self._verified_this_run and entry is not None:
+            entry['stamp'] = self.stamp_function(workspace)
+
+    def save(self):
+        """
+        Writes the registry file, including the canonical definitions for reference
+
+        The registry is written to a temporary file that then replaces the old
+        one, so an interrupted run or two runs at once never leave a partly
+        written file. When two runs save, the last one wins.
+
+        :return:
+        """
+        if not self.path:
+            return
+        registry = {'definitions': dict((name, {'hash': self.hashes[name], 'definition': spec})
+                                        for name, spec in sorted(self.definitions.items())),
+                    'workspaces': self.workspaces}
+        folder = os.path.dirname(os.path.abspath(self.path))
+        temp_path = None
+        try:
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            handle, temp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + '.', dir=folder)
+            with os.fdopen(handle, 'w') as registry_file:
+                json.dump(registry, registry_file, indent=2, sort_keys=True)
+            os.replace(temp_path, self.path)
+        except (IOError, OSError) as e:
+            arcpy.AddWarning("The domain registry {} could not be saved: {}".format(self.path, e))
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @staticmethod
+    def _key(workspace):
+        return os.path.normcase(os.path.abspath(workspace))
@@ -0,0 +1,283 @@
+# -*- coding: UTF-8 -*-
+"""
+   Copyright 2020 Aaron J White
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+       http://www.apache.org/licenses/LICENSE-2.0
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.​
+    This sample exports the GNSS and Wet Weather Inspection fields of feature classes
+    to a columnar folder of NumPy .npy files.
+"""
+import arcpy
+import argparse
+import json
+import numpy as np
+import os
+
+from chunkedCursor import COLUMN_TYPES, DEFAULT_CHUNK_SIZE, CursorStats, get_array_type, is_null, read_chunks
+from schemaTemplates import TEMPLATES, get_workspace
+
+SCHEMA_FIELDS = frozenset(spec['name'] for template in TEMPLATES.values() for spec in template['fields'])
+MANIFEST_NAME = 'manifest.json'
+
+
+def is_schema_field(field_name):
+    """
+    Checks if a field is one of the fields of the templates in schemaTemplates
+
+    :param field_name: (string) The field name
+    :return: (boolean)
+    """
+    return field_name in SCHEMA_FIELDS
+
+
+def make_column(field, domain):
+    """
+    Works out how a field is stored
+
+    Fields with a coded value domain are stored as integer indexes into the
+    domain's codes, -1 for nulls. Values missing from the domain are added to
+    the end of the code list as they are found. Text fields without a domain
+    are stored the same way against a list of the distinct values found, so
+    a 50 character receiver name costs one index instead of 200 bytes a row.
+    Free text with mostly unique values gains nothing from this and its
+    values are all held in memory and in the manifest.
+
+    The indexes are written as int32 and narrowed by narrow_column once the
+    number of codes is known.
+
+    :param field: (arcpy Field) The field to store
+    :param domain: (arcpy Domain) The field's domain, or None
+    :return: (dict) The column description written to the manifest
+    """
+    column = {'name': field.name, 'alias': field.aliasName, 'field_type': field.type,
+              'file': '{}.npy'.format(field.name)}
+    if domain is not None and domain.domainType == 'CodedValue':
+        coded_values = list(domain.codedValues.items())
+        column['dtype'] = 'i4'
+        column['null'] = -1
+        column['domain'] = {'name': domain.name,
+                            'codes': [code for code, description in coded_values],
+                            'descriptions': [description for code, description in coded_values]}
+    elif field.type in COLUMN_TYPES:
+        column['dtype'], column['null'] = COLUMN_TYPES[field.type]
+        # NaN and NaT can not be written to JSON, readers know them from the dtype
+        if np.dtype(column['dtype']).kind in 'fM':
+            column['null'] = None
+    elif field.type == 'String':
+        column['dtype'] = 'i4'
+        column['null'] = -1
+        column['values'] = []
+    else:
+        return None
+    return column
+
+
+def get_codes(column):
+    """
+    Gets the list of values a dictionary column's indexes point into
+
+    :param column: (dict) The column description
+    :return: (list) The domain codes, or the distinct values of a text column
+    """
+    return column['domain']['codes'] if 'domain' in column else column['values']
+
+
+def encode_values(column, values, null_value, lookup):
+    """
+    Converts a chunk of values to the column's dictionary indexes
+
+    :param column: (dict) The column description
+    :param values: (numpy array) The values read by read_chunks
+    :param null_value: (any) The value read_chunks stored for nulls
+    :param lookup: (dict) Code to index of the column's codes, updated with new codes
+    :return: (numpy array) The encoded values
+    """
+    codes = get_codes(column)
+    unique_values, inverse = np.unique(values, return_inverse=True)
+    nulls = is_null(unique_values, null_value).tolist()
+    indexes = []
+    for value, null in zip(unique_values.tolist(), nulls):
+        if null:
+            indexes.append(-1)
+            continue
+        if value not in lookup:
+            lookup[value] = len(codes)
+            codes.append(value)
+            if 'domain' in column:
+                column['domain']['descriptions'].append(str(value))
+        indexes.append(lookup[value])
+    return np.array(indexes, dtype=column['dtype'])[inverse.ravel()]
+
+
+def narrow_column(path, column, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Rewrites a dictionary column with the smallest integer type that holds its codes
+
+    The column is copied a chunk at a time into a new file that then replaces
+    the old one, so memory does not grow with the number of rows.
+
+    :param path: (string) The column's .npy file
+    :param column: (dict) The column description, its dtype is updated
+    :param chunk_size: (int) The number of rows to copy at a time
+    :return:
+    """
+    for dtype in ('i1', 'i2'):
+        if len(get_codes(column)) <= np.iinfo(dtype).max:
+            break
+    else:
+        return
+
+    narrow_path = path + '.tmp'
+    wide = np.load(path, mmap_mode='r')
+    narrow = np.lib.format.open_memmap(narrow_path, mode='w+', dtype=dtype, shape=wide.shape)
+    for start in range(0, len(wide), chunk_size):
+        narrow[start:start + chunk_size] = wide[start:start + chunk_size]
+    narrow.flush()
+    del narrow, wide
+    os.replace(narrow_path, path)
+    column['dtype'] = dtype
+
+
+def export_layer(feature_layer, output_folder, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """
+    Exports the GNSS and Wet Weather Inspection fields of a layer
+
+    Each field is written to its own .npy file in output_folder, a chunk of
+    rows at a time, so memory does not grow with the size of the layer
+    (other than the distinct values of text fields, see make_column). The
+    column types, null values and coded domain and text value tables are
+    written to manifest.json.
+
+    Example: export_layer(r"C:/temp/test.gdb/test", r"C:/temp/export/test")
+
+    :param feature_layer: (string) The feature layer to export
+    :param output_folder: (string) The folder to write the columns to
+    :param chunk_size: (int) The number of rows to read at a time
+    :param stats: (CursorStats) Optional counters of the rows read
+    :return: (dict) The manifest
+    """
+
+    try:
+        desc = arcpy.Describe(feature_layer)
+        domains = {}
+        if r'/rest/services' not in desc.catalogPath:
+            domains = dict((domain.name, domain) for domain in
+                           arcpy.da.ListDomains(get_workspace(desc.catalogPath)))
+
+        columns = []
+        for field in arcpy.ListFields(feature_layer):
+            if field.type != 'OID' and not is_schema_field(field.name):
+                continue
+            column = make_column(field, domains.get(field.domain))
+            if column is not None:
+                columns.append(column)
+
+        if len(columns) < 2:
+            arcpy.AddWarning("{} has no GNSS or Wet Weather fields to export".format(feature_layer))
+            return
+
+        row_count = int(arcpy.GetCount_management(feature_layer)[0])
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
+
+        arrays = [np.lib.format.open_memmap(os.path.join(output_folder, column['file']),
+                                            mode='w+', dtype=column['dtype'], shape=(row_count,))
+                  for column in columns]
+        lookups = [dict((code, i) for i, code in enumerate(get_codes(column)))
+                   if 'domain' in column or 'values' in column else None for column in columns]
+
+        names = [column['name'] for column in columns]
+        null_values = get_array_type(feature_layer, names)[1]
+        written = 0
+        for chunk in read_chunks(feature_layer, names, chunk_size=chunk_size, stats=stats):
+            if written + len(chunk) > row_count:
+                raise ValueError("{} changed while it was being exported".format(feature_layer))
+            for i, column in enumerate(columns):
+                values = chunk[column['name']]
+                if lookups[i] is not None:
+                    values = encode_values(column, values, null_values[i], lookups[i])
+                arrays[i][written:written + len(chunk)] = values
+            written += len(chunk)
+
+        # No reference to a memory map may be left, Windows can not replace a
+        # mapped file in narrow_column
+        while arrays:
+            arrays.pop().flush()
+        for column, lookup in zip(columns, lookups):
+            if lookup is not None:
+                narrow_column(os.path.join(output_folder, column['file']), column, chunk_size)
+
+        manifest = {'layer': desc.catalogPath, 'rows': written, 'columns': columns}
+        with open(os.path.join(output_folder, MANIFEST_NAME), 'w') as output:
+            json.dump(manifest, output, indent=2)
+        return manifest
+
+    except Exception as e:
+        arcpy.AddError("{}\n".format(e))
+        return
+
+
+def read_export(export_folder):
+    """
+    Opens an exported layer without loading it into memory
+
+    Example: manifest, columns = read_export(r"C:/temp/export/test")
+
+    :param export_folder: (string) The folder written by export_layer
+    :return: (tuple) The manifest and a dict of field name to memory-mapped array
+    """
+    with open(os.path.join(export_folder, MANIFEST_NAME)) as manifest_file:
+        manifest = json.load(manifest_file)
+    columns = {}
+    for column in manifest['columns']:
+        array = np.load(os.path.join(export_folder, column['file']), mmap_mode='r')
+        columns[column['name']] = array[:manifest['rows']]
+    return manifest, columns
+
+
+def decode_column(column, values, descriptions=True):
+    """
+    Turns the stored indexes of a dictionary column back into codes or descriptions
+
+    :param column: (dict) The column description from the manifest
+    :param values: (numpy array) The stored indexes
+    :param descriptions: (boolean) Return the code descriptions rather than the codes,
+                         text columns without a domain only have their values
+    :return: (numpy array) The decoded values, None for nulls
+    """
+    if 'domain' not in column:
+        table = column['values']
+    else:
+        table = column['domain']['descriptions' if descriptions else 'codes']
+    table = np.array(table + [None], dtype=object)
+    return table[np.where(values < 0, len(table) - 1, values)]
+
+
+if __name__ == "__main__":
+    """
+        Commandline use to export the GNSS and Wet Weather fields of layers
+
+        Input: layer names (fully qualified paths) and the folder to export to,
+        each layer is written to a sub folder named after it
+
+        Example: python exportSchemaFields.py "C:/temp/test.gdb/test" "C:/temp/test.gdb/test2" --output "C:/temp/export"
+    """
+    parser = argparse.ArgumentParser("Export GNSS and Wet Weather Fields to Columnar Files")
+    parser.add_argument("layers", nargs='+', help="The layers to export")
+    parser.add_argument("--output", required=True, help="The folder to export to")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="The number of rows to read at a time")
+    parser.add_argument("--stats", action="store_true",
+                        help="Report the rows read, rows per second and buffer memory")
+    args = parser.parse_args()
+    stats = CursorStats() if args.stats else None
+    for layer in args.layers:
+        export_layer(layer, os.path.join(args.output, os.path.basename(layer)), args.chunk_size, stats)
+    if stats is not None:
+        arcpy.AddMessage(repr(stats))
@@ -0,0 +1,363 @@
+# -*- coding: UTF-8 -*-
+"""
+   Copyright 2020 Aaron J White
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+       http://www.apache.org/licenses/LICENSE-2.0
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.​
+    This sample reports on the GNSS accuracy metadata collected in feature classes.
+"""
+import arcpy
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import math
+import numpy as np
+
+from chunkedCursor import DEFAULT_CHUNK_SIZE, CursorStats, get_array_type, is_null, read_chunks
+from schemaTemplates import get_workspace
+
+ACCURACY_FIELDS = ('ESRIGNSS_H_RMS', 'ESRIGNSS_V_RMS', 'ESRIGNSS_PDOP')
+CODED_FIELDS = {'ESRIGNSS_FIXTYPE': 'ESRI_FIX_TYPE_DOMAIN',
+                'ESRIGNSS_POSITIONSOURCETYPE': 'ESRI_POSITIONSOURCETYPE_DOMAIN'}
+PERCENTILES = (50, 90, 95, 99)
+DEFAULT_THRESHOLDS = (0.05, 0.1, 0.5, 1.0)
+
+
+class QuantileSketch(object):
+    """
+    Mergeable quantile sketch with a fixed relative accuracy
+
+    Values are counted in logarithmically sized buckets so any quantile is
+    returned within relative_accuracy of the true value. Memory only grows with
+    the spread of the values (about 460 buckets per factor of 10,000 at 1%),
+    never with the number of rows, and is capped at max_buckets by folding the
+    smallest buckets together.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values):
+        """
+        Adds an array of values, NaN values are skipped
+
+        :param values: (numpy array) The values to add
+        :return:
+        """
+        values = np.asarray(values, dtype='f8')
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        if len(positive):
+            keys = np.ceil(np.log(positive) / self._log_gamma).astype('i8')
+            for key, count in zip(*np.unique(keys, return_counts=True)):
+                self.buckets[int(key)] = self.buckets.get(int(key), 0) + int(count)
+            self._collapse()
+
+    def merge(self, other):
+        """
+        Adds the counts of another sketch with the same accuracy into this one
+
+        :param other: (QuantileSketch) The sketch to merge in
+        :return:
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Can not merge sketches with different accuracies")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._collapse()
+
+    def quantile(self, q):
+        """
+        Gets the approximate value at a quantile
+
+        :param q: (float) The quantile, between 0 and 1
+        :return: (float) The value, or None if the sketch is empty
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                value = 2 * self._gamma ** key / (self._gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def _collapse(self):
+        if len(self.buckets) <= self.max_buckets:
+            return
+        keys = sorted(self.buckets)
+        folded = keys[:len(keys) - self.max_buckets + 1]
+        total = sum(self.buckets.pop(key) for key in folded)
+        self.buckets[folded[-1]] = total
+
+
+class GnssQualitySummary(object):
+    """
+    Running GNSS accuracy counts for one or more layers
+
+    Summaries are built a chunk of rows at a time and can be merged, so
+    layers can be summarised in parallel and combined afterwards.
+    """
+
+    def __init__(self, thresholds=DEFAULT_THRESHOLDS):
+        self.thresholds = tuple(sorted(thresholds))
+        self.rows = 0
+        self.sketches = dict((field, QuantileSketch()) for field in ACCURACY_FIELDS)
+        self.below = dict((field, [0] * len(self.thresholds))
+                          for field in ('ESRIGNSS_H_RMS', 'ESRIGNSS_V_RMS'))
+        self.codes = dict((field, collections.Counter()) for field in CODED_FIELDS)
+
+    def add_chunk(self, columns, rows):
+        """
+        Adds a chunk of rows
+
+        :param columns: (dict) Field name to numpy array of that field's values in the chunk, NaN for nulls
+        :param rows: (int) The number of rows in the chunk
+        :return:
+        """
+        self.rows += rows
+        for field, sketch in self.sketches.items():
+            if field in columns:
+                sketch.add(columns[field])
+        for field, counts in self.below.items():
+            if field in columns:
+                values = columns[field]
+                for i, threshold in enumerate(self.thresholds):
+                    counts[i] += int(np.count_nonzero(values < threshold))
+        for field, counter in self.codes.items():
+            if field in columns:
+                values = np.asarray(columns[field], dtype='f8')
+                nulls = np.isnan(values)
+                if nulls.any():
+                    counter[None] += int(np.count_nonzero(nulls))
+                for code, count in zip(*np.unique(values[~nulls], return_counts=True)):
+                    counter[int(code)] += int(count)
+
+    def merge(self, other):
+        """
+        Adds the counts of another summary into this one
+
+        :param other: (GnssQualitySummary) The summary to merge in
+        :return:
+        """
+        if other.thresholds != self.thresholds:
+            raise ValueError("Can not merge summaries with different thresholds")
+        self.rows += other.rows
+        for field, sketch in self.sketches.items():
+            sketch.merge(other.sketches[field])
+        for field, counts in self.below.items():
+            for i, count in enumerate(other.below[field]):
+                counts[i] += count
+        for field, counter in self.codes.items():
+            counter.update(other.codes[field])
+
+    def as_dict(self, descriptions=None):
+        """
+        Gets the summary as plain values for reporting
+
+        :param descriptions: (dict) Optional field name to {code: description} used to decode the coded fields
+        :return: (dict) The summary
+        """
+        descriptions = descriptions or {}
+        result = {'rows': self.rows}
+        for field, sketch in self.sketches.items():
+            result[field] = {'count': sketch.count,
+                             'percentiles': dict(('p{}'.format(p), sketch.quantile(p / 100.0))
+                                                 for p in PERCENTILES)}
+        for field, counts in self.below.items():
+            total = self.sketches[field].count
+            result[field]['share_below'] = dict(
+                (str(threshold), float(count) / total if total else None)
+                for threshold, count in zip(self.thresholds, counts))
+        for field, counter in self.codes.items():
+            names = descriptions.get(field, {})
+            result[field] = dict((names.get(code, 'Null' if code is None else str(code)), count)
+                                 for code, count in sorted(counter.items(), key=lambda item: str(item[0])))
+        return result
+
+
+def get_domain_descriptions(geodatabase):
+    """
+    Gets the code descriptions of the fix type and position source domains
+
+    :param geodatabase: (string) the path to the geodatabase to read the domains from
+    :return: (dict) Field name to {code: description}
+    """
+    domains = dict((domain.name, domain) for domain in arcpy.da.ListDomains(geodatabase))
+    descriptions = {}
+    for field, domain_name in CODED_FIELDS.items():
+        if domain_name in domains:
+            descriptions[field] = dict(domains[domain_name].codedValues)
+    return descriptions
+
+
+def summarize_layer(feature_layer, thresholds=DEFAULT_THRESHOLDS, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """
+    Reads the GNSS accuracy fields of a layer once, a chunk of rows at a time
+
+    Only the running counts and sketches are kept, so memory does not grow
+    with the size of the layer
+
+    :param feature_layer: (string) The feature layer to summarise
+    :param thresholds: (list) The accuracies (m) to report the share of points below
+    :param chunk_size: (int) The number of rows to read at a time
+    :param stats: (CursorStats) Optional counters of the rows read
+    :return: (GnssQualitySummary) The summary of the layer
+    """
+    summary = GnssQualitySummary(thresholds)
+    existing_fields = [field.name for field in arcpy.ListFields(feature_layer)]
+    fields = [field for field in ACCURACY_FIELDS + tuple(CODED_FIELDS) if field in existing_fields]
+    if not fields:
+        arcpy.AddWarning("{} has no GNSS metadata fields".format(feature_layer))
+        return summary
+
+    null_values = get_array_type(feature_layer, fields)[1]
+    for chunk in read_chunks(feature_layer, fields, chunk_size=chunk_size, stats=stats):
+        columns = dict((field, np.where(is_null(chunk[field], null_value), np.nan, chunk[field]))
+                       for field, null_value in zip(fields, null_values))
+        summary.add_chunk(columns, len(chunk))
+
+    return summary
+
+
+def summarize_layer_with_stats(feature_layer, thresholds=DEFAULT_THRESHOLDS, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Summarises a layer with its own counters, for worker processes
+
+    :return: (tuple) The GnssQualitySummary and CursorStats of the layer
+    """
+    stats = CursorStats()
+    return summarize_layer(feature_layer, thresholds, chunk_size, stats), stats
+
+
+def report_summary(title, summary, descriptions):
+    """
+    Writes a summary to the geoprocessing messages
+
+    :param title: (string) The heading for the summary
+    :param summary: (GnssQualitySummary) The summary to report
+    :param descriptions: (dict) Field name to {code: description} used to decode the coded fields
+    :return: (dict) The reported values
+    """
+    values = summary.as_dict(descriptions)
+    arcpy.AddMessage("{} ({} points)".format(title, values['rows']))
+    for field in ACCURACY_FIELDS:
+        percentiles = ', '.join('{} {}'.format(name, 'n/a' if value is None else '{:.3f}'.format(value))
+                                for name, value in values[field]['percentiles'].items())
+        arcpy.AddMessage("  {}: {}".format(field, percentiles))
+        for threshold, share in values[field].get('share_below', {}).items():
+            if share is not None:
+                arcpy.AddMessage("    below {} m: {:.1%}".format(threshold, share))
+    for field in CODED_FIELDS:
+        counts = ', '.join('{}: {}'.format(name, count) for name, count in values[field].items())
+        arcpy.AddMessage("  {}: {}".format(field, counts or 'none'))
+    return values
+
+
+def gnss_quality_report(feature_layers, thresholds=DEFAULT_THRESHOLDS, chunk_size=DEFAULT_CHUNK_SIZE, workers=1,
+                        stats=None):
+    """
+    Reports the GNSS accuracy of each layer and of each workspace
+
+    Example: gnss_quality_report([r"C:/temp/test.gdb/test", r"C:/temp/test.gdb/test2"])
+
+    :param feature_layers: (list) The feature layers to report on
+    :param thresholds: (list) The accuracies (m) to report the share of points below
+    :param chunk_size: (int) The number of rows to read at a time
+    :param workers: (int) The number of layers to summarise in parallel
+    :param stats: (CursorStats) Optional counters of the rows read, with workers
+                  their seconds are added together
+    :return: (dict) The reported values by layer and by workspace
+    """
+    if workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(summarize_layer_with_stats, feature_layers,
+                                        itertools.repeat(thresholds),
+                                        itertools.repeat(chunk_size)))
+        summaries = [summary for summary, layer_stats in results]
+        if stats is not None:
+            for summary, layer_stats in results:
+                stats.merge(layer_stats)
+    else:
+        summaries = [summarize_layer(layer, thresholds, chunk_size, stats) for layer in feature_layers]
+
+    workspaces = collections.OrderedDict()
+    report = {'layers': {}, 'workspaces': {}}
+    for layer, summary in zip(feature_layers, summaries):
+        catalog_path = arcpy.Describe(layer).catalogPath
+        if r'/rest/services' in catalog_path:
+            workspace = None
+            descriptions = {}
+        else:
+            workspace = get_workspace(catalog_path)
+            if workspace not in workspaces:
+                workspaces[workspace] = (GnssQualitySummary(thresholds), get_domain_descriptions(workspace))
+            workspaces[workspace][0].merge(summary)
+            descriptions = workspaces[workspace][1]
+        report['layers'][layer] = report_summary(layer, summary, descriptions)
+
+    for workspace, (summary, descriptions) in workspaces.items():
+        report['workspaces'][workspace] = report_summary(workspace, summary, descriptions)
+
+    return report
+
+
+if __name__ == "__main__":
+    """
+        Commandline use to report on the GNSS metadata of layers
+
+        Input: layer names (fully qualified paths)
+
+        Example: python gnssQualityReport.py "C:/temp/test.gdb/test" "C:/temp/test.gdb/test2" --workers 2
+    """
+    parser = argparse.ArgumentParser("Report GNSS Accuracy of Feature Layers")
+    parser.add_argument("layers", nargs='+', help="The layers to report on")
+    parser.add_argument("--threshold", type=float, action="append", dest="thresholds",
+                        help="Report the share of points more accurate than this (m), can be repeated")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="The number of rows to read at a time")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="The number of layers to read in parallel")
+    parser.add_argument("--output", help="Also write the report to this JSON file")
+    parser.add_argument("--stats", action="store_true",
+                        help="Report the rows read, rows per second and buffer memory")
+    args = parser.parse_args()
+    stats = CursorStats() if args.stats else None
+    report = gnss_quality_report(args.layers, args.thresholds or DEFAULT_THRESHOLDS,
+                                 args.chunk_size, args.workers, stats)
+    if stats is not None:
+        arcpy.AddMessage(repr(stats))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
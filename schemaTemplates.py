@@ -0,0 +1,333 @@
+# -*- coding: UTF-8 -*-
+"""
+   Copyright 2020 Aaron J White
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+       http://www.apache.org/licenses/LICENSE-2.0
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.​
+    This sample adds the fields and domains of one or more schema templates
+    (GNSS metadata, Wet Weather Inspection) to feature classes in a single pass.
+"""
+import arcpy
+import argparse
+import collections
+import os
+
+
+def coded_domain(name, description, field_type, coded_values):
+    """
+    Describes a coded value domain for a template
+
+    :param name: (string) The domain name
+    :param description: (string) The domain description
+    :param field_type: (string) The field type of the codes
+    :param coded_values: (list) The (code, description) pairs
+    :return: (dict) The domain description
+    """
+    return {'name': name, 'description': description, 'field_type': field_type,
+            'domain_type': 'CODED', 'coded_values': tuple(coded_values)}
+
+
+def range_domain(name, description, field_type, minimum, maximum):
+    """
+    Describes a range domain for a template
+
+    :param name: (string) The domain name
+    :param description: (string) The domain description
+    :param field_type: (string) The field type of the range
+    :param minimum: (number) The lowest allowed value
+    :param maximum: (number) The highest allowed value
+    :return: (dict) The domain description
+    """
+    return {'name': name, 'description': description, 'field_type': field_type,
+            'domain_type': 'RANGE', 'range': (minimum, maximum)}
+
+
+def template_field(name, field_type, alias, length=None, domain=None):
+    """
+    Describes a field for a template
+
+    :param name: (string) The field name
+    :param field_type: (string) The AddFields field type
+    :param alias: (string) The field alias
+    :param length: (int) The field length for text fields
+    :param domain: (string) The name of the field's domain
+    :return: (dict) The field description
+    """
+    return {'name': name, 'field_type': field_type, 'alias': alias,
+            'length': length, 'domain': domain}
+
+
+GNSS_TEMPLATE = {
+    'domains': (
+        coded_domain('ESRI_FIX_TYPE_DOMAIN', 'Fix Type', 'SHORT',
+                     ((0, 'Fix not valid'), (1, 'GPS'), (2, 'Differential GPS'),
+                      (4, 'RTK Fixed'), (5, 'RTK Float'))),
+        range_domain('ESRI_NUM_SATS_DOMAIN', 'Number of Satellites', 'SHORT', 0, 99),
+        range_domain('ESRI_STATION_ID_DOMAIN', 'Station ID', 'SHORT', 0, 1023),
+        coded_domain('ESRI_POSITIONSOURCETYPE_DOMAIN', 'Position Source Type', 'SHORT',
+                     ((0, 'Unknown'), (1, 'User defined'),
+                      (2, 'Integrated (System) Location Provider'),
+                      (3, 'External GNSS Receiver'), (4, 'Network Location Provider'))),
+    ),
+    'fields': (
+        template_field('ESRIGNSS_POSITIONSOURCETYPE', 'SHORT', 'Position source type',
+                       domain='ESRI_POSITIONSOURCETYPE_DOMAIN'),
+        template_field('ESRIGNSS_RECEIVER', 'TEXT', 'Receiver Name', length=50),
+        template_field('ESRIGNSS_LATITUDE', 'DOUBLE', 'Latitude'),
+        template_field('ESRIGNSS_LONGITUDE', 'DOUBLE', 'Longitude'),
+        template_field('ESRIGNSS_ALTITUDE', 'DOUBLE', 'Altitude'),
+        template_field('ESRIGNSS_H_RMS', 'DOUBLE', 'Horizontal Accuracy (m)'),
+        template_field('ESRIGNSS_V_RMS', 'DOUBLE', 'Vertical Accuracy (m)'),
+        template_field('ESRIGNSS_FIXDATETIME', 'DATE', 'Fix Time'),
+        template_field('ESRIGNSS_FIXTYPE', 'SHORT', 'Fix Type', domain='ESRI_FIX_TYPE_DOMAIN'),
+        template_field('ESRIGNSS_CORRECTIONAGE', 'DOUBLE', 'Correction Age'),
+        template_field('ESRIGNSS_STATIONID', 'SHORT', 'Station ID', domain='ESRI_STATION_ID_DOMAIN'),
+        template_field('ESRIGNSS_NUMSATS', 'SHORT', 'Number of Satellites', domain='ESRI_NUM_SATS_DOMAIN'),
+        template_field('ESRIGNSS_PDOP', 'DOUBLE', 'PDOP'),
+        template_field('ESRIGNSS_HDOP', 'DOUBLE', 'HDOP'),
+        template_field('ESRIGNSS_VDOP', 'DOUBLE', 'VDOP'),
+        template_field('ESRIGNSS_DIRECTION', 'DOUBLE', 'Direction of travel (°)'),
+        template_field('ESRIGNSS_SPEED', 'DOUBLE', 'Speed (km/h)'),
+        template_field('ESRISNSR_AZIMUTH', 'DOUBLE', 'Compass reading (°)'),
+        template_field('ESRIGNSS_AVG_H_RMS', 'DOUBLE', 'Average Horizontal Accuracy (m)'),
+        template_field('ESRIGNSS_AVG_V_RMS', 'DOUBLE', 'Average Vertical Accuracy (m)'),
+        template_field('ESRIGNSS_AVG_POSITIONS', 'SHORT', 'Averaged Positions'),
+        template_field('ESRIGNSS_H_STDDEV', 'DOUBLE', 'Standard Deviation (m)'),
+    ),
+}
+
+WET_WEATHER_TEMPLATE = {
+    'domains': (
+        coded_domain('Yes_No', 'Yes or No', 'TEXT',
+                     (('Yes', 'Yes'), ('No', 'No'), ('N/A', 'N/A'))),
+        coded_domain('Inspector', 'Inspector', 'TEXT',
+                     [(code, code) for code in ('ALA', 'BAR', 'BUR', 'CAS', 'JJH', 'JLK', 'JWN',
+                                                'MJT', 'REM', 'RWG', 'SAB', 'SJS', 'SUB', 'WBH')]),
+        coded_domain('Flow_Percent', 'Flow Percentage', 'TEXT',
+                     (('0', '0% (No Flow)'), ('25', '25%'), ('50', '50%'),
+                      ('75', '75%'), ('100', '100%'))),
+        coded_domain('Clock_Pos', 'Clock Position', 'TEXT',
+                     [(str(hour), "{} o'clock".format(hour))
+                      for hour in (1, 10, 11, 12, 2, 3, 4, 5, 6, 7, 8, 9)]),
+    ),
+    'fields': (
+        template_field('Inspected_By1', 'TEXT', 'Inspector-1:', domain='Inspector'),
+        template_field('Inspected_By2', 'TEXT', 'Inspector-2:', domain='Inspector'),
+        template_field('Inspec_Num', 'DOUBLE', 'Wet Weather Inspection #:'),
+        template_field('Clear_Flow', 'TEXT', 'Clear Flow In Manhole:', domain='Yes_No'),
+        template_field('ESRISNSR_AZIMUTH', 'DOUBLE', 'Compass reading (°)'),
+    ),
+}
+
+TEMPLATES = collections.OrderedDict((('gnss', GNSS_TEMPLATE),
+                                     ('wet_weather', WET_WEATHER_TEMPLATE)))
+
+
+def build_plan(template_names):
+    """
+    Merges templates into one plan of the domains and fields to add
+
+    Domains and fields that appear in more than one template (like
+    ESRISNSR_AZIMUTH) are only planned once. If two templates define the same
+    name differently a ValueError is raised.
+
+    Example: build_plan(['gnss', 'wet_weather'])
+
+    :param template_names: (list) The names of the templates in TEMPLATES
+    :return: (dict) Ordered dicts of the domains and fields by name
+    """
+    plan = {'domains': collections.OrderedDict(), 'fields': collections.OrderedDict()}
+    for template_name in template_names:
+        if template_name not in TEMPLATES:
+            raise ValueError("Unknown template {}, expected one of {}".format(
+                template_name, ', '.join(TEMPLATES)))
+        template = TEMPLATES[template_name]
+        for kind in ('domains', 'fields'):
+            for spec in template[kind]:
+                planned = plan[kind].setdefault(spec['name'], spec)
+                if planned != spec:
+                    raise ValueError("{} is defined differently by template {}".format(
+                        spec['name'], template_name))
+
+    for spec in plan['fields'].values():
+        if spec['domain'] and spec['domain'] not in plan['domains']:
+            raise ValueError("{} uses domain {} which no template defines".format(
+                spec['name'], spec['domain']))
+    return plan
+
+
+def get_workspace(catalog_path):
+    """
+    Gets the parent geodatabase from a layer's catalog path
+
+    :param catalog_path: (string) The catalog path of the layer
+    :return: (string) The path to the geodatabase
+    """
+    workspace = os.path.dirname(catalog_path)
+    if os.path.splitext(workspace)[1].lower() in ('.gdb', '.mdb', '.sde'):
+        return workspace
+    else:
+        return os.path.dirname(workspace)
+
+
+def check_and_create_domains(geodatabase, plan, registry=None, add_missing_codes=True):
+    """
+    Checks the planned domains against the geodatabase, creating any that are missing
+
+    Coded value domains that already exist have any missing codes added, or
+    with add_missing_codes False they are an error (355) and left alone.
+    Range domains that already exist must have the planned range.
+
+    If a registry is passed, geodatabases it has already verified and that
+    have not changed since are skipped without listing their domains
+
+    :param geodatabase: (string) the path to the geodatabase to check
+    :param plan: (dict) The plan from build_plan
+    :param registry: (DomainRegistry) Optional registry of verified geodatabases
+    :param add_missing_codes: (boolean) Add missing codes to existing coded value domains
+    :return: (boolean) True if the domains are ready to use
+    """
+    if registry is not None and registry.is_verified(geodatabase, plan['domains']):
+        return True
+
+    domains = dict((domain.name, domain) for domain in arcpy.da.ListDomains(geodatabase))
+    for name, spec in plan['domains'].items():
+        domain = domains.get(name)
+        if domain is None:
+            arcpy.CreateDomain_management(in_workspace=geodatabase,
+                                          domain_name=name,
+                                          domain_description=spec['description'],
+                                          field_type=spec['field_type'],
+                                          domain_type=spec['domain_type'],
+                                          split_policy="DEFAULT",
+                                          merge_policy="DEFAULT")
+            if spec['domain_type'] == 'RANGE':
+                arcpy.SetValueForRangeDomain_management(geodatabase, name, *spec['range'])
+
+        if spec['domain_type'] == 'RANGE':
+            if domain is not None and tuple(domain.range) != spec['range']:
+                arcpy.AddIDMessage("ERROR", 355)
+                return False
+            continue
+
+        existing_codes = set(domain.codedValues) if domain is not None else set()
+        missing = [(code, description) for code, description in spec['coded_values']
+                   if code not in existing_codes]
+        if domain is not None and missing and not add_missing_codes:
+            arcpy.AddIDMessage("ERROR", 355)
+            return False
+        for code, description in missing:
+            arcpy.AddCodedValueToDomain_management(in_workspace=geodatabase,
+                                                   domain_name=name,
+                                                   code=str(code),
+                                                   code_description=description)
+
+    if registry is not None:
+        registry.mark_verified(geodatabase, plan['domains'])
+    return True
+
+
+def apply_plan(feature_layer, plan, checked_workspaces=None, registry=None):
+    """
+    Adds the planned fields to a layer and assigns their domains
+
+    The layer is described and its fields listed once, all of the missing
+    fields are added with a single AddFields call and the domains of each
+    workspace are only checked once per run.
+
+    This will report errors if:
+        1) The input layer is not a point layer
+        2) The layer is not found
+        3) The layer is a shapefile
+
+    Example: apply_plan(r"C:/temp/test.gdb/test", build_plan(['gnss', 'wet_weather']))
+
+    :param feature_layer: (string) The feature layer to add the fields to
+    :param plan: (dict) The plan from build_plan
+    :param checked_workspaces: (dict) Workspace path to the result of its domain check, shared between layers
+    :param registry: (DomainRegistry) Optional registry of geodatabases whose domains are already verified
+    :return:
+    """
+    if checked_workspaces is None:
+        checked_workspaces = {}
+
+    try:
+        # need to know dataType of input
+        desc = arcpy.Describe(feature_layer)
+        dataType = desc.dataType.lower()
+        if dataType == "featurelayer":
+            dataType = desc.dataElement.dataType.lower()
+
+        # catch invalid inputs
+        if dataType == "shapefile":
+            arcpy.AddIDMessage("ERROR", 656)
+            return
+
+        if dataType != "featureclass" or desc.shapeType.lower() != "point":
+            arcpy.AddIDMessage("ERROR", 347)
+            return
+
+        # Check the domains once per geodatabase, services manage their own
+        geodatabase = None
+        if r'/rest/services' not in desc.catalogPath:
+            geodatabase = get_workspace(desc.catalogPath)
+            if geodatabase not in checked_workspaces:
+                checked_workspaces[geodatabase] = check_and_create_domains(geodatabase, plan, registry)
+            if not checked_workspaces[geodatabase]:
+                return
+
+        existingFields = dict((field.name, field) for field in arcpy.ListFields(feature_layer))
+
+        # Add all of the missing fields at once
+        newFields = [[spec['name'], spec['field_type'], spec['alias'],
+                      spec['length'] or '', '', spec['domain'] or '']
+                     for name, spec in plan['fields'].items() if name not in existingFields]
+        if newFields:
+            arcpy.AddFields_management(feature_layer, newFields)
+
+        # Update existing fields with Domains
+        for name, spec in plan['fields'].items():
+            if spec['domain'] and name in existingFields and not existingFields[name].domain:
+                arcpy.AssignDomainToField_management(feature_layer, name, spec['domain'])
+
+        if registry is not None and geodatabase is not None:
+            registry.refresh_stamp(geodatabase)
+
+    except Exception as e:
+        arcpy.AddError("{}\n".format(e))
+        return
+
+
+if __name__ == "__main__":
+    """
+        Commandline use to add the fields of one or more templates to layers
+
+        Input: layer names (fully qualified paths)
+
+        Example: python schemaTemplates.py "C:/temp/test.gdb/test" "C:/temp/test.gdb/test2" --template gnss --template wet_weather
+    """
+    parser = argparse.ArgumentParser("Add Template Fields to Feature Layers")
+    parser.add_argument("layers", nargs='+', help="The layers to add fields to")
+    parser.add_argument("--template", action="append", dest="templates", required=True,
+                        choices=list(TEMPLATES), help="The template to apply, can be repeated")
+    parser.add_argument("--registry", help="The domain registry file of already verified geodatabases")
+    parser.add_argument("--no-registry", action="store_true",
+                        help="Check the domains of every geodatabase without the registry")
+    args = parser.parse_args()
+
+    # imported here as domainRegistry reads its canonical definitions from this module
+    from domainRegistry import DEFAULT_REGISTRY_PATH, DomainRegistry
+    registry = None if args.no_registry else DomainRegistry(args.registry or DEFAULT_REGISTRY_PATH)
+
+    plan = build_plan(args.templates)
+    checked_workspaces = {}
+    for layer in args.layers:
+        apply_plan(layer, plan, checked_workspaces, registry)
+    if registry is not None:
+        registry.save()